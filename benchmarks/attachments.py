@@ -0,0 +1,53 @@
+"""Measures what a Paginator page flip allocates to resend a page's attachments.
+
+    python -m benchmarks.attachments --size 51200 --flips 100
+
+Compares deep-copying the page's File, which is what pages did before Unit held
+Attachments, with handing out a fresh File from ``Unit.files``.
+"""
+from __future__ import annotations
+
+import argparse
+import copy
+import os
+import time
+import tracemalloc
+from io import BytesIO
+from typing import Callable, List
+
+from discord import File
+
+from hk.files import shared_file
+from hk.views import Unit
+
+
+def measure(name: str, flip: Callable[[], List[File]], flips: int):
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(flips):
+        files = flip()
+        del files
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<32} peak {peak:>9,} bytes   {elapsed / flips * 1e6:8.1f} us/flip")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--size", type=int, default=50 * 1024, help="attachment size in bytes")
+    parser.add_argument("--flips", type=int, default=100)
+    args = parser.parse_args()
+
+    data = os.urandom(args.size)
+    plain = File(BytesIO(data), filename="track.webp")
+    shared = shared_file(data, "track.webp")
+    unit = Unit(files=[shared_file(data, "track.webp")])
+    print(f"one {args.size:,} byte attachment, {args.flips} flips")
+    measure("deepcopy of File(BytesIO)", lambda: [copy.deepcopy(plain)], args.flips)
+    measure("deepcopy of File(SharedBuffer)", lambda: [copy.deepcopy(shared)], args.flips)
+    measure("Unit.files", lambda: unit.files, args.flips)
+
+
+if __name__ == "__main__":
+    main()
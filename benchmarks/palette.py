@@ -0,0 +1,117 @@
+"""Times banner palette extraction over real thumbnails, optionally against ColorThief.
+
+    python -m benchmarks.palette thumbnails/ --fetch dQw4w9WgXcQ ... --colorthief
+
+Thumbnails are read from the given files and directories; ``--fetch`` downloads
+YouTube thumbnails by video id into the first directory first. ``--colorthief``
+also runs what banners used before (``get_color(100)`` and ``get_palette(15, 100)``,
+needs ``pip install colorthief``) and reports how far the dominant colours are apart.
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import time
+import urllib.request
+from io import BytesIO
+from pathlib import Path
+from typing import Callable, List, Tuple
+
+from PIL import Image
+
+from hk.music.palette import RGB, quantize
+
+THUMBNAIL = "https://i.ytimg.com/vi/{0}/hqdefault.jpg"
+SUFFIXES = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def fetch(ids: List[str], directory: Path):
+    directory.mkdir(parents=True, exist_ok=True)
+    for _id in ids:
+        file = directory / f"{_id}.jpg"
+        if file.exists():
+            continue
+        try:
+            with urllib.request.urlopen(THUMBNAIL.format(_id), timeout=10) as resp:
+                file.write_bytes(resp.read())
+        except OSError as e:
+            print(f"skipping {_id}: {e}")
+
+
+def corpus(paths: List[Path]) -> List[Tuple[str, bytes]]:
+    files: List[Path] = []
+    for path in paths:
+        if path.is_dir():
+            files += sorted(f for f in path.iterdir() if f.suffix.lower() in SUFFIXES)
+        elif path.is_file():
+            files.append(path)
+    return [(file.name, file.read_bytes()) for file in files]
+
+
+def ours(data: bytes) -> RGB:
+    return quantize(Image.open(BytesIO(data)), 15)[0]
+
+
+def colorthief(data: bytes) -> RGB:
+    from colorthief import ColorThief
+
+    cf = ColorThief(BytesIO(data))
+    cf.get_palette(15, 100)
+    return cf.get_color(100)
+
+
+def timed(fn: Callable[[bytes], RGB], images: List[Tuple[str, bytes]], repeat: int):
+    times: List[float] = []
+    colors: List[RGB] = []
+    for _, data in images:
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            color = fn(data)
+            best = min(best, time.perf_counter() - start)
+        times.append(best)
+        colors.append(color)
+    return times, colors
+
+
+def summary(name: str, times: List[float]):
+    ms = sorted(t * 1000 for t in times)
+    p95 = ms[min(int(len(ms) * 0.95), len(ms) - 1)]
+    print(f"{name:<11} median {statistics.median(ms):7.2f} ms   p95 {p95:7.2f} ms   total {sum(ms):8.1f} ms")
+
+
+def distance(a: RGB, b: RGB) -> float:
+    return sum((x - y) ** 2 for x, y in zip(a, b)) ** 0.5
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("paths", nargs="+", type=Path, help="thumbnail files or directories")
+    parser.add_argument("--fetch", nargs="*", default=[], metavar="ID", help="video ids to download")
+    parser.add_argument("--colorthief", action="store_true", help="compare against ColorThief")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per image, the fastest counts")
+    args = parser.parse_args()
+
+    if args.fetch:
+        fetch(args.fetch, args.paths[0])
+    images = corpus(args.paths)
+    if not images:
+        parser.error("no thumbnails found")
+    print(f"{len(images)} thumbnails")
+    times, colors = timed(ours, images, args.repeat)
+    summary("quantize", times)
+    if not args.colorthief:
+        return
+    theirs, before = timed(colorthief, images, args.repeat)
+    summary("colorthief", theirs)
+    gaps = [distance(a, b) for a, b in zip(colors, before)]
+    print(
+        f"dominant colour distance (RGB): median {statistics.median(gaps):.1f}, "
+        f"max {max(gaps):.1f}, {sum(g < 32 for g in gaps)}/{len(gaps)} within 32"
+    )
+    for (name, _), a, b, gap in sorted(zip(images, colors, before, gaps), key=lambda r: -r[3])[:5]:
+        print(f"  {name}: {a} vs {b} ({gap:.1f})")
+
+
+if __name__ == "__main__":
+    main()
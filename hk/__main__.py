@@ -1,33 +1,22 @@
 import asyncio
-import logging
-import logging.handlers
 
 from .bot import Bot
+from .launcher import Supervisor, setup_logging
 from .settings import Config
 
-logger = logging.getLogger("discord")
-logger.setLevel(logging.ERROR)
 
-handler = logging.handlers.RotatingFileHandler(
-    filename="discord.log",
-    encoding="utf-8",
-    maxBytes=32 * 1024 * 1024,  # 32 MiB
-    backupCount=5,  # Rotate through 5 files
-)
-dt_fmt = "%Y-%m-%d %H:%M:%S"
-formatter = logging.Formatter(
-    "[{asctime}] [{levelname:<8}] {name}: {message}", dt_fmt, style="{"
-)
-handler.setFormatter(formatter)
-logger.addHandler(handler)
-
-
-async def main():
-    bot = Bot(Config())
+async def main(conf: Config):
+    bot = Bot(conf)
     await bot.start()
 
 
-try:
-    asyncio.run(main())
-except KeyboardInterrupt:
-    exit()
+if __name__ == "__main__":  # process pool workers re-import this module
+    setup_logging()
+    conf = Config()
+    try:
+        if conf.processes > 1:
+            Supervisor(conf).run()
+        else:
+            asyncio.run(main(conf))
+    except KeyboardInterrupt:
+        exit()
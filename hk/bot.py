@@ -1,45 +1,109 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import inspect
+import json
 import sys
+import time
 import traceback
 from pathlib import Path
 from textwrap import dedent
-from typing import Any
+from typing import Any, Dict, Optional
 
 from aiohttp import ClientSession
 from colorama import Fore
 from discord import Intents
 from discord.ext import commands
 
+from .http import create_session
+from .metrics import metrics
 from .settings import Config
 from . import __version__
 
 
-class Bot(commands.Bot):
+class Bot(commands.AutoShardedBot):
     conf: Config
     session: ClientSession
 
-    def __init__(self, conf: Config, *args: Any, **kwargs: Any):
+    def __init__(self, conf: Config, *args: Any, primary: bool = True, **kwargs: Any):
         super().__init__(command_prefix=conf.prefix, intents=Intents._from_value(conf.intents), *args, **kwargs)  # type: ignore
         self.conf = conf
+        self.primary = primary  # only one of several shard processes syncs the command tree
+        self.booted = time.perf_counter()
+        self.startup: Optional[float] = None  # seconds from construction to the first on_ready
 
     async def start(self, *args: Any, **kwargs: Any):
-        self.session = ClientSession()
+        self.session = create_session(self.conf.http)
         return await super().start(self.conf.env["DISCORD"], *args, **kwargs)
 
+    async def close(self) -> None:
+        await super().close()
+        await metrics.stop()
+        if hasattr(self, "session"):
+            await self.session.close()
+
     async def setup_hook(self) -> None:
-        for file in Path("hk/extensions").glob("**/*.py"):
-            *tree, _ = file.parts
-            try:
-                await self.load_extension(f"{'.'.join(tree)}.{file.stem}")
-            except Exception as e:
+        if (conf := self.conf.metrics).enabled:
+            port = conf.port
+            if port is not None and self.shard_ids:
+                port += self.shard_ids[0]  # one endpoint per shard process
+            await metrics.start(host=conf.host, port=port, log_interval=conf.log_interval)
+
+        names = [
+            f"{'.'.join(file.parent.parts)}.{file.stem}"
+            for file in Path("hk/extensions").glob("**/*.py")
+        ]
+        results = await asyncio.gather(
+            *(self.load_extension(name) for name in names), return_exceptions=True
+        )
+        for e in results:
+            if isinstance(e, BaseException):
                 traceback.print_exception(type(e), e, e.__traceback__, file=sys.stderr)
-        for ex in self.conf.extensions:
-            await self.load_extension(ex)
+        await asyncio.gather(*(self.load_extension(ex) for ex in self.conf.extensions))
 
+        await self.sync_tree()
+
+    def tree_hash(self) -> str:
+        """Hashes the global command tree as it would be sent to Discord"""
+        commands = sorted(
+            (self.command_payload(command) for command in self.tree.get_commands()),
+            key=lambda c: (c.get("type", 1), c["name"]),
+        )
+        payload = json.dumps([self.application_id, commands], sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def command_payload(self, command: Any) -> Dict[str, Any]:
+        # discord.py 2.4 made the tree a required argument of to_dict
+        if "tree" in inspect.signature(command.to_dict).parameters:
+            return command.to_dict(self.tree)
+        return command.to_dict()
+
+    async def sync_tree(self):
+        """Syncs the command tree, unless it's unchanged since the last sync.
+
+        The global sync endpoint is heavily rate limited, so restarts that don't touch
+        any command shouldn't spend a call on it.
+        """
+        if not self.primary:
+            return
+        path = Path(self.conf.sync_file)
+        digest = self.tree_hash()
+        if path.is_file() and path.read_text() == digest:
+            return
         await self.tree.sync()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(digest)
+
+    def owns(self, guild: int) -> bool:
+        """Whether the guild belongs to one of this process's shards"""
+        if self.shard_ids is None:
+            return True
+        return (guild >> 22) % (self.shard_count or 1) in self.shard_ids
 
     async def on_ready(self):
+        if self.startup is None:
+            self.startup = time.perf_counter() - self.booted
         print(
             dedent(
                 f"""
@@ -58,6 +122,7 @@ class Bot(commands.Bot):
             Commands: {len(self.tree.get_commands())}
             Extensions: {len(self.extensions)}
             Cogs: {len(self.cogs)}
+            Ready in: {self.startup:.2f}s
             """
             )
         )
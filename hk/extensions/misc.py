@@ -13,8 +13,8 @@ class Action(Protocol):
 
     @classmethod
     async def get_data(cls, session: ClientSession):
-        resp = await session.get(cls.url)
-        return await resp.json()
+        async with session.get(cls.url) as resp:
+            return await resp.json()
 
     @classmethod
     async def get_url(cls, session: ClientSession) -> str:
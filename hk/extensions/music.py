@@ -1,6 +1,7 @@
+import asyncio
 from dataclasses import dataclass
 from logging import getLogger
-from typing import Any, Dict, Optional, Union, cast
+from typing import Any, Dict, List, Optional, Union, cast
 
 from discord import (
     ButtonStyle,
@@ -9,6 +10,7 @@ from discord import (
     Interaction,
     Member,
     SelectOption,
+    VoiceChannel,
     app_commands,
 )
 from discord.ext import commands
@@ -18,8 +20,10 @@ from discord.utils import MISSING
 from hk.music.errors import NoVoiceException
 
 from ..bot import Bot
+from ..metrics import metrics
 from ..music import (
     YTDL,
+    Banner,
     BasePlaylist,
     BaseTrack,
     DifferentVoiceException,
@@ -28,7 +32,7 @@ from ..music import (
     Voice,
 )
 from ..protocols import GuildMessageable
-from ..views import Paginator, Unit
+from ..views import PageSource, Paginator, Unit
 
 logger = getLogger("discord")
 
@@ -173,29 +177,42 @@ class PlayView(BaseMusicView):
         await self.queue.put(track)
 
 
+class QueuePages(PageSource):
+    """Renders the queue 10 tracks per page, after a now playing page"""
+
+    def __init__(self, bot: Bot, queue: Queue):
+        self.bot = bot
+        self.queue = queue
+
+    @property
+    def version(self):
+        return self.queue.version
+
+    def __len__(self):
+        return 1 + -(-self.queue.qsize() // 10)
+
+    async def render(self, page: int) -> Unit:
+        color = self.bot.conf.color
+        if page == 0:
+            if np := self.queue.voice.track:
+                banner = await np.create_banner(self.bot.session)
+                embed = banner.embed.set_footer(
+                    text=f"{self.queue.progress}\n{self.queue.qsize()} tracks left"
+                )
+                return Unit(embed=embed, files=[banner.file()])
+            return Unit(embed=Embed(description="The queue is empty :(", color=color))
+        i = (page - 1) * 10
+        content = "\n".join(
+            f"{i+x}. {t.title}" for x, t in enumerate(self.queue.tracks.page(i, i + 10))
+        )
+        return Unit(embed=Embed(description=f"```md\n{content}\n```", color=color))
+
+
 class QueueView(Paginator):
     @classmethod
     async def display(cls, payload: Payload, queue: Queue):
-        tracks = list(queue.deque)
-        bot = payload.bot
-        if np := queue.voice.track:
-            banner = await np.create_banner(bot.session)
-            embed = banner.embed.set_footer(
-                text=f"{queue.progress}\n{queue.qsize()} tracks left"
-            )
-            start = Unit(embed=embed, files=[banner.file()])
-        else:
-            start = Unit(
-                embed=Embed(description="The queue is empty :(", color=bot.conf.color)
-            )
-        items = [start]
-        for i in range(0, len(tracks), 10):
-            content = "\n".join(
-                f"{i+x}. {t.title}" for x, t in enumerate(tracks[i : i + 10])
-            )
-            embed = Embed(description=f"```md\n{content}\n```", color=bot.conf.color)
-            items.append(Unit(embed=embed))
-        view = cls(payload.bot, *items)
+        view = cls(payload.bot, source=QueuePages(payload.bot, queue))
+        start = await view.get(0)
         await payload.interaction.response.send_message(
             embed=start.embed or MISSING, files=start.files, view=view, ephemeral=True
         )
@@ -205,6 +222,84 @@ class Music(commands.Cog):
     def __init__(self, bot: Bot):
         self.bot = bot
         self.queues: Dict[Guild, Queue] = {}
+        self.restored = False
+        YTDL.configure(bot.conf.music)
+        Banner.configure(bot.conf.music)
+        Voice.configure(bot.conf.music)
+        Queue.configure(bot.conf.music)
+        metrics.collect("music", self.samples)
+        self.preparing: Optional[asyncio.Task[None]] = None
+
+    async def cog_load(self):
+        self.preparing = asyncio.create_task(self.prepare())  # off the startup path
+
+    @staticmethod
+    async def prepare():
+        """Indexes downloaded audio and purges expired rows, the on-disk caches never shrink otherwise"""
+        results = await asyncio.gather(
+            Voice.downloads.scan(), YTDL.purge(), Banner.purge(), return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                logger.warning(f"Failed to prepare the on-disk caches: {result!r}")
+
+    async def cog_unload(self):
+        if self.preparing is not None:
+            self.preparing.cancel()
+        await Queue.journal.flush()
+        YTDL.pool.shutdown()
+        Banner.pool.shutdown()
+        Voice.downloads.shutdown()
+
+    def samples(self):
+        """Cache hit rates and sizes, worker pool depth and queue counts for the metrics exporter"""
+        caches = {
+            "metadata": YTDL.cache.stats(),
+            "search": YTDL.searches.stats(),
+            "banner": Banner.cache.stats(),
+        }
+        for cache, stats in caches.items():
+            for result in ("hits", "misses"):
+                yield f"hk_cache_{result}", {"cache": cache}, stats[result]
+        lrus = {
+            "metadata": YTDL.cache.memory,
+            "search": YTDL.searches.memory,
+            "banner": Banner.cache,
+        }
+        for cache, lru in lrus.items():
+            stats = lru.stats()
+            yield "hk_cache_entries", {"cache": cache}, stats["size"]
+            yield "hk_cache_evictions_total", {"cache": cache}, stats["evictions"]
+        yield "hk_cache_bytes", {"cache": "banner"}, Banner.cache.weight  # weighed by encoded size
+        yield "hk_cache_max_bytes", {"cache": "banner"}, Banner.cache.maxsize
+        for pool in (YTDL.pool, Banner.pool, Voice.downloads.pool):
+            yield "hk_pool_pending", {"pool": pool.name}, pool.pending
+        flights = YTDL.flights.stats()
+        yield "hk_extract_shared_total", {}, flights["shared"]
+        yield "hk_queues", {}, len(self.queues)
+        yield "hk_queued_tracks", {}, sum(queue.qsize() for queue in self.queues.values())
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        """Rejoins voice and resumes every queue journaled before the last shutdown"""
+        if self.restored:  # on_ready fires again after reconnects
+            return
+        self.restored = True
+        for state in (await Queue.journal.load(self.bot.owns)).values():
+            guild = self.bot.get_guild(state.guild)
+            channel = guild and state.voice and guild.get_channel(state.voice)
+            bound = guild and state.bound and guild.get_channel(state.bound)
+            if not (guild and isinstance(channel, VoiceChannel) and bound):
+                Queue.journal.forget(state.guild)
+                continue
+            try:
+                if guild.voice_client is None:
+                    await channel.connect(cls=Voice)
+                queue = Queue(self.bot, bound=cast(GuildMessageable, bound))
+                self.queues[guild] = queue
+                await queue.restore(state)
+            except Exception as e:
+                logger.error(f"Failed to restore the queue for {guild}: {e}")
 
     def get_queue(self, payload: Payload):
         return self.queues.setdefault(
@@ -219,12 +314,24 @@ class Music(commands.Cog):
         queue = self.get_queue(payload)
         await PlayView.display(payload, queue, query)
 
+    @play.autocomplete("query")
+    async def query_autocomplete(
+        self, iact: Interaction, current: str
+    ) -> List[app_commands.Choice[str]]:
+        """Suggests titles the bot has already resolved, without any network calls"""
+        guild = iact.guild.id if iact.guild else None
+        return [
+            app_commands.Choice(name=entry.title[:100], value=entry.value)
+            for entry in YTDL.index.search(current, guild=guild)
+        ]
+
     @app_commands.command()
     async def pause(self, iact: Interaction):
         """Pause the current track"""
         payload = await Payload.validate(self.bot, iact)
         queue = self.get_queue(payload)
         queue.voice.pause()
+        queue.refresh()
         await iact.response.send_message(
             embed=Embed(description="Paused!", color=self.bot.conf.color)
         )
@@ -235,6 +342,7 @@ class Music(commands.Cog):
         payload = await Payload.validate(self.bot, iact)
         queue = self.get_queue(payload)
         queue.voice.resume()
+        queue.refresh()
         await iact.response.send_message(
             embed=Embed(description="Resumed!", color=self.bot.conf.color)
         )
@@ -246,17 +354,12 @@ class Music(commands.Cog):
         payload = await Payload.validate(self.bot, iact)
         queue = self.get_queue(payload)
         if to > queue.qsize():
-            embed = Embed(
-                description=f"There are only {queue.qsize()} tracks in the queue!"
-                if not queue.empty()
-                else "The queue is empty!",
-                color=self.bot.conf.color,
-            )
+            embed = Embed(description=self.out_of_range(queue), color=self.bot.conf.color)
         elif np := queue.voice.track:
             banner = await np.create_banner(self.bot.session)
             embed = banner.embed
             embed.description = "Skipping"
-            skipped = [queue.deque.popleft() for _ in range(to)]
+            skipped = queue.skip(to)
             text = np.title
             if skipped:
                 text += f"\n(and {len(skipped)} tracks)"
@@ -266,6 +369,80 @@ class Music(commands.Cog):
             embed = Embed(description="Nothing to skip :(", color=self.bot.conf.color)
         await iact.response.send_message(embed=embed)
 
+    @app_commands.command()
+    @app_commands.describe(position="Where to seek to, e.g. 90, 1:30 or 1:02:03")
+    async def seek(self, iact: Interaction, position: str):
+        """Seek to a position in the current track"""
+        payload = await Payload.validate(self.bot, iact)
+        queue = self.get_queue(payload)
+        try:
+            seconds = sum(
+                float(part) * 60**i for i, part in enumerate(reversed(position.split(":")))
+            )
+        except ValueError:
+            seconds = -1
+        if not (track := queue.voice.track):
+            text = "Nothing is playing :("
+        elif not 0 <= seconds < track.duration:
+            text = f"Pick a position between 0 and {track.duration / 60:.2f} minutes!"
+        else:
+            queue.voice.seek(int(seconds * 1000))
+            queue.refresh()
+            text = f"Seeked to {int(seconds // 60)}:{int(seconds % 60):02}"
+        await iact.response.send_message(
+            embed=Embed(description=text, color=self.bot.conf.color)
+        )
+
+    @app_commands.command()
+    @app_commands.describe(index="The index of the track to remove")
+    async def remove(self, iact: Interaction, index: int):
+        """Remove a track from the queue"""
+        payload = await Payload.validate(self.bot, iact)
+        queue = self.get_queue(payload)
+        if not 0 <= index < queue.qsize():
+            text = self.out_of_range(queue)
+        else:
+            text = f"Removed {queue.remove(index).title}"
+        await iact.response.send_message(
+            embed=Embed(description=text, color=self.bot.conf.color)
+        )
+
+    @app_commands.command()
+    @app_commands.describe(
+        index="The index of the track to move", to="The index to move it to"
+    )
+    async def move(self, iact: Interaction, index: int, to: int):
+        """Move a track to another position in the queue"""
+        payload = await Payload.validate(self.bot, iact)
+        queue = self.get_queue(payload)
+        if not (0 <= index < queue.qsize() and 0 <= to < queue.qsize()):
+            text = self.out_of_range(queue)
+        else:
+            text = f"Moved {queue.move(index, to).title} to {to}"
+        await iact.response.send_message(
+            embed=Embed(description=text, color=self.bot.conf.color)
+        )
+
+    @app_commands.command()
+    async def shuffle(self, iact: Interaction):
+        """Shuffle the upcoming tracks"""
+        payload = await Payload.validate(self.bot, iact)
+        queue = self.get_queue(payload)
+        if queue.empty():
+            text = "The queue is empty!"
+        else:
+            queue.shuffle()
+            text = f"Shuffled {queue.qsize()} tracks!"
+        await iact.response.send_message(
+            embed=Embed(description=text, color=self.bot.conf.color)
+        )
+
+    @staticmethod
+    def out_of_range(queue: Queue):
+        if queue.empty():
+            return "The queue is empty!"
+        return f"There are only {queue.qsize()} tracks in the queue!"
+
     @app_commands.command()
     async def queue(self, iact: Interaction):
         """See the current and upcoming tracks"""
@@ -298,6 +475,7 @@ class Music(commands.Cog):
         queue = self.get_queue(payload)
         if volume:
             queue.voice.volume = volume
+            queue.refresh()
 
         await iact.response.send_message(
             embed=Embed(
@@ -311,6 +489,7 @@ class Music(commands.Cog):
         payload = await Payload.validate(self.bot, iact)
         queue = self.get_queue(payload)
         text = f"Looping is now {'on' if queue.repeat() else 'off'}!"
+        queue.refresh()
         await iact.response.send_message(
             embed=Embed(description=text, color=self.bot.conf.color)
         )
@@ -327,12 +506,15 @@ class Music(commands.Cog):
         banner = await item.create_banner(session=session)
         await iact.followup.send(embed=banner.embed, file=banner.file())
 
+    banner.autocomplete("query")(query_autocomplete)
+
     @app_commands.command()
     async def disconnect(self, iact: Interaction):
         """Disconnects the bot from the voice channel and resets the queue."""
         await iact.response.defer()
         payload = await Payload.validate(self.bot, iact)
         queue = self.get_queue(payload)
+        queue.close()
         await queue.voice.disconnect()
         del self.queues[payload.guild]
         await iact.delete_original_response()
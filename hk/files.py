@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from io import BytesIO, UnsupportedOperation
+from typing import Any, Optional
+
+from discord import File
+
+__all__ = ("Attachment", "SharedBuffer", "shared_file")
+
+
+class SharedBuffer(BytesIO):
+    """Read-only BytesIO over an immutable payload.
+
+    CPython's BytesIO shares its initial ``bytes`` object until the first write,
+    so refusing writes means every buffer made from the same payload reads the
+    same memory and creating one costs nothing but the object itself.
+    """
+
+    def __init__(self, data: bytes):
+        super().__init__(data)
+        self._data = data
+
+    def writable(self):
+        return False
+
+    def write(self, *args: Any):
+        raise UnsupportedOperation("SharedBuffer is read-only")
+
+    def writelines(self, *args: Any):
+        raise UnsupportedOperation("SharedBuffer is read-only")
+
+    def truncate(self, *args: Any):
+        raise UnsupportedOperation("SharedBuffer is read-only")
+
+    def getbuffer(self):
+        # BytesIO.getbuffer would unshare (copy) the payload to hand out a writable view
+        return memoryview(self._data)
+
+
+def shared_file(data: bytes, filename: str):
+    """Returns a discord File reading from ``data`` without copying it"""
+    return File(SharedBuffer(data), filename=filename)
+
+
+@dataclass(frozen=True)
+class Attachment:
+    """A file's payload, read once and handed out as a fresh File for every send"""
+
+    data: bytes
+    filename: str
+    spoiler: bool = False
+    description: Optional[str] = None
+
+    @classmethod
+    def from_file(cls, file: File) -> Attachment:
+        if isinstance(file.fp, SharedBuffer):
+            data = file.fp._data
+        else:
+            file.reset()
+            data = file.fp.read()
+            file.close()
+        return cls(data, file.filename, file.spoiler, file.description)
+
+    def file(self):
+        return File(
+            SharedBuffer(self.data),
+            filename=self.filename,
+            spoiler=self.spoiler,
+            description=self.description,
+        )
@@ -0,0 +1,24 @@
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+
+from .settings import HTTPConfig
+
+__all__ = ("create_session",)
+
+
+def create_session(conf: HTTPConfig) -> ClientSession:
+    """Returns the bot's shared ClientSession, with bounded connection pools and timeouts.
+
+    Must be called from within the running event loop.
+    """
+    connector = TCPConnector(
+        limit=conf.limit,
+        limit_per_host=conf.limit_per_host,
+        ttl_dns_cache=conf.dns_ttl,
+        keepalive_timeout=conf.keepalive,
+    )
+    timeout = ClientTimeout(
+        total=conf.timeout,
+        connect=conf.connect_timeout,
+        sock_read=conf.read_timeout,
+    )
+    return ClientSession(connector=connector, timeout=timeout)
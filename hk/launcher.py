@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import logging.handlers
+import time
+from multiprocessing import get_context
+from multiprocessing.process import BaseProcess
+from typing import Dict, List
+
+from discord.http import HTTPClient
+
+from .bot import Bot
+from .settings import Config
+
+__all__ = ("setup_logging", "plan", "recommended_shards", "Supervisor")
+
+logger = logging.getLogger("discord")
+
+IDENTIFY_INTERVAL = 5  # seconds Discord wants between shard identifies
+MIN_UPTIME = 60  # workers exiting sooner than this are restarted with a backoff
+
+
+def setup_logging(filename: str = "discord.log"):
+    logger.setLevel(logging.ERROR)
+    handler = logging.handlers.RotatingFileHandler(
+        filename=filename,
+        encoding="utf-8",
+        maxBytes=32 * 1024 * 1024,  # 32 MiB
+        backupCount=5,  # Rotate through 5 files
+    )
+    dt_fmt = "%Y-%m-%d %H:%M:%S"
+    formatter = logging.Formatter(
+        "[{asctime}] [{levelname:<8}] {name}: {message}", dt_fmt, style="{"
+    )
+    handler.setFormatter(formatter)
+    logger.addHandler(handler)
+
+
+async def recommended_shards(token: str) -> int:
+    """Asks Discord how many shards the bot should run"""
+    http = HTTPClient(asyncio.get_running_loop())
+    try:
+        await http.static_login(token)
+        shards = (await http.get_bot_gateway())[0]  # the tuple grew a third item in 2.x
+    finally:
+        await http.close()
+    return shards
+
+
+def plan(shard_count: int, processes: int) -> List[List[int]]:
+    """Deals shard ids out to processes round robin"""
+    return [list(range(p, shard_count, processes)) for p in range(processes)]
+
+
+def work(index: int, shard_ids: List[int], shard_count: int):
+    """Worker process entrypoint, runs one Bot for the given shards"""
+    setup_logging(f"discord-{index}.log")  # rotating one file from many processes races
+    bot = Bot(Config(), shard_ids=shard_ids, shard_count=shard_count, primary=index == 0)
+    try:
+        asyncio.run(bot.start())
+    except KeyboardInterrupt:
+        pass
+
+
+class Supervisor:
+    """Spreads the bot's shards over worker processes and restarts any that exit.
+
+    Every worker has its own event loop, GIL, voice player threads, worker pools and
+    queues, so capacity grows with cores. They share only the settings file and the
+    SQLite stores under ``cache_dir``. Only the first worker syncs the command tree.
+    """
+
+    def __init__(self, conf: Config):
+        self.conf = conf
+        self.context = get_context("spawn")
+        self.assignments: List[List[int]] = []
+        self.shard_count = 0
+        self.processes: Dict[int, BaseProcess] = {}
+        self.started: Dict[int, float] = {}
+        self.failures: Dict[int, int] = {}
+        self.due: Dict[int, float] = {}  # restart time of workers waiting out a backoff
+
+    def spawn(self, index: int):
+        process = self.context.Process(
+            target=work,
+            args=(index, self.assignments[index], self.shard_count),
+            name=f"hk-shards-{index}",
+        )
+        process.start()
+        self.processes[index] = process
+        self.started[index] = time.monotonic()
+
+    def check(self, index: int, process: BaseProcess):
+        now = time.monotonic()
+        if index in self.due:
+            if now >= self.due[index]:
+                del self.due[index]
+                self.spawn(index)
+            return
+        if process.is_alive():
+            return
+        if now - self.started[index] < MIN_UPTIME:
+            self.failures[index] = self.failures.get(index, 0) + 1
+        else:
+            self.failures[index] = 0
+        delay = min(2 ** self.failures[index], 300) if self.failures[index] else 0
+        logger.error(
+            f"Shard process {index} exited with {process.exitcode}, restarting in {delay}s"
+        )
+        self.due[index] = now + delay
+
+    def run(self):
+        self.shard_count = max(
+            self.conf.shards or asyncio.run(recommended_shards(self.conf.env["DISCORD"])),
+            self.conf.processes,
+        )
+        self.assignments = plan(self.shard_count, self.conf.processes)
+        for index, shard_ids in enumerate(self.assignments):
+            self.spawn(index)
+            time.sleep(IDENTIFY_INTERVAL * len(shard_ids))  # let its shards identify first
+        try:
+            while True:
+                time.sleep(1)
+                for index, process in list(self.processes.items()):
+                    self.check(index, process)
+        finally:
+            for process in self.processes.values():
+                process.terminate()
+            for process in self.processes.values():
+                process.join(10)
@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from bisect import bisect_left
+from functools import wraps
+from logging import getLogger
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
+
+from aiohttp import web
+
+__all__ = ("Counter", "Histogram", "Metrics", "metrics", "timed")
+
+logger = getLogger("discord.metrics")
+
+T = TypeVar("T")
+Labels = Tuple[Tuple[str, str], ...]
+Sample = Tuple[str, Dict[str, Any], float]  # (name, labels, value)
+
+LATENCY = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any):
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        # voice player threads add labels while we export, iterate over a snapshot
+        for labels, value in list(self.values.items()):
+            yield f"{self.name}{format_labels(labels)} {value}"
+
+
+class Histogram:
+    """Counts observations into fixed, cumulative-on-export buckets"""
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = LATENCY):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        total = 0
+        for bound, count in zip((*self.buckets, "+Inf"), list(self.counts)):
+            total += count
+            yield f'{self.name}_bucket{{le="{bound}"}} {total}'
+        yield f"{self.name}_sum {self.sum}"
+        yield f"{self.name}_count {self.count}"
+
+
+class Metrics:
+    """Process-wide metrics registry.
+
+    Disabled by default: hot paths check ``enabled`` before taking any timings,
+    so instrumentation costs one attribute lookup until ``start`` is called.
+    Values that already live elsewhere (cache stats, pool depth) are read by
+    collectors at export time instead of being tracked as they change.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.metrics: Dict[str, Any] = {}
+        self.collectors: Dict[str, Callable[[], Iterable[Sample]]] = {}
+        self.tasks: List[asyncio.Task[None]] = []
+        self.runner: Optional[web.AppRunner] = None
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self.metrics.setdefault(name, Counter(name, help))
+
+    def histogram(
+        self, name: str, help: str, buckets: Sequence[float] = LATENCY
+    ) -> Histogram:
+        return self.metrics.setdefault(name, Histogram(name, help, buckets))
+
+    def collect(self, name: str, collector: Callable[[], Iterable[Sample]]):
+        """Registers (or replaces) a function returning gauge samples, called on every export"""
+        self.collectors[name] = collector
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in list(self.metrics.values()):
+            lines.extend(metric.render())
+        for name, collector in list(self.collectors.items()):
+            try:
+                samples = list(collector())
+            except Exception as e:
+                logger.warning(f"Metrics collector {name} failed: {e}")
+                continue
+            for sample, labels, value in samples:
+                key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+                lines.append(f"{sample}{format_labels(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+    async def watch_loop(self, interval: float = 0.5):
+        """Measures event loop lag as how late a sleep wakes up"""
+        lag = self.histogram("hk_event_loop_lag_seconds", "Event loop wakeup delay")
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            lag.observe(max(time.perf_counter() - start - interval, 0))
+
+    async def dump(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                logger.info("Metrics\n" + self.render())
+            except Exception as e:
+                logger.error(f"Failed to dump metrics: {e!r}")
+
+    async def handle(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.render(), content_type="text/plain", charset="utf-8")
+
+    async def start(
+        self,
+        *,
+        host: str = "127.0.0.1",
+        port: Optional[int] = None,
+        log_interval: Optional[float] = None,
+    ):
+        """Turns collection on and starts the loop monitor and exporters"""
+        self.enabled = True
+        self.tasks.append(asyncio.create_task(self.watch_loop()))
+        if log_interval:
+            logger.setLevel(logging.INFO)  # the discord logger only lets errors through
+            self.tasks.append(asyncio.create_task(self.dump(log_interval)))
+        if port is not None:
+            app = web.Application()
+            app.router.add_get("/metrics", self.handle)
+            self.runner = web.AppRunner(app, access_log=None)
+            await self.runner.setup()
+            await web.TCPSite(self.runner, host, port).start()
+
+    async def stop(self):
+        self.enabled = False
+        for task in self.tasks:
+            task.cancel()
+        self.tasks.clear()
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+
+metrics = Metrics()
+
+
+def timed(
+    name: str, help: str
+) -> Callable[[Callable[..., Awaitable[T]]], Callable[..., Awaitable[T]]]:
+    """Records how long an async function takes, when metrics are enabled"""
+    histogram = metrics.histogram(name, help)
+
+    def decorator(fn: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+        @wraps(fn)
+        async def wrapper(*args: Any, **kwargs: Any) -> T:
+            if not metrics.enabled:
+                return await fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
@@ -1,5 +1,11 @@
 from .audio import *
+from .blocklist import *
+from .cache import *
+from .downloads import *
 from .errors import *
+from .index import *
+from .persist import *
+from .pool import *
 from .queue import *
 from .track import *
 from .ytdl import *
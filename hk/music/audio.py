@@ -1,63 +1,386 @@
+import threading
+import time
 from asyncio import Event, Lock
+from dataclasses import dataclass
 from io import BufferedIOBase
-from typing import Any, Callable, Optional, cast, Union
+from pathlib import Path
+from typing import Any, Callable, Optional, Union, cast
 
-from discord import AudioSource, FFmpegPCMAudio, PCMVolumeTransformer, VoiceClient
+from discord import (
+    AudioSource,
+    FFmpegOpusAudio,
+    FFmpegPCMAudio,
+    PCMVolumeTransformer,
+    VoiceClient,
+)
 
+from ..metrics import metrics
+from ..settings import MusicConfig
+from .downloads import AudioCache
 from .track import Track
 
 FFMPEG_OPTS = {
     "before_options": "-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5",
     "options": "-vn",
 }
+LOCAL_OPTS = {"before_options": "", "options": "-vn"}  # no reconnect flags for files
+LATE = 0.025  # seconds between frames past which one counts as late, each frame is 20ms
 
+frames = metrics.counter("hk_audio_frames_total", "Audio frames sent")
+late_frames = metrics.counter(
+    "hk_audio_late_frames_total", "Audio frames sent more than 5ms past their 20ms slot"
+)
 
-class Audio(PCMVolumeTransformer[AudioSource]):
-    """AudioSource to keep track of amount of data read (in ms)"""
+
+def seek_opts(opts: dict[str, str], offset: int) -> dict[str, str]:
+    """Adds input seeking to ffmpeg options, so ffmpeg skips to ``offset`` ms without decoding up to it"""
+    if not offset:
+        return opts
+    return {**opts, "before_options": f"-ss {offset / 1000:.3f} {opts['before_options']}"}
+
+
+class Progress(AudioSource):
+    """Keeps track of the amount of audio read (in ms), every frame is 20ms"""
+
+    done: int = 0
+
+    def read(self) -> bytes:
+        self.done += 20
+        return super().read()
+
+    def seconds(self):
+        return round(self.done / 1000, 2)
+
+
+class Audio(Progress, PCMVolumeTransformer[AudioSource]):
+    """PCM AudioSource, volume is scaled in Python and can change while playing"""
 
     def __init__(
         self,
         stream: Union[str, BufferedIOBase],
         volume: float = 0.5,
         *,
+        offset: int = 0,
         opts: dict[str, str] = FFMPEG_OPTS
     ):
-        source = FFmpegPCMAudio(stream, **opts)
+        source = FFmpegPCMAudio(stream, **seek_opts(opts, offset))
         super().__init__(source, volume)
-        self.done = 0
+        self.done = offset
 
-    def read(self):
-        self.done += 20
-        return super().read()
 
-    def seconds(self):
-        return round(self.done / 1000, 2)
+class OpusAudio(Progress, FFmpegOpusAudio):
+    """Opus AudioSource, ffmpeg hands discord.py ready-made Opus packets.
+
+    Opus sources at full volume are stream copied; anything else is filtered and
+    encoded inside ffmpeg. Either way no PCM passes through Python, but volume is
+    fixed for the lifetime of the source.
+    """
+
+    def __init__(
+        self,
+        stream: Union[str, BufferedIOBase],
+        volume: float = 0.5,
+        *,
+        codec: Optional[str] = None,
+        offset: int = 0,
+        opts: dict[str, str] = FFMPEG_OPTS
+    ):
+        opts = seek_opts(opts, offset)
+        options = opts["options"]
+        if volume != 1:
+            codec = None  # filters need a decode, let ffmpeg re-encode with libopus
+            options += f" -filter:a volume={volume}"
+        super().__init__(
+            stream, codec=codec, before_options=opts["before_options"], options=options
+        )
+        self.volume = volume
+        self.done = offset
+
+
+@dataclass
+class Preloaded:
+    source: Audio
+    duration: int  # ms
+    tag: Any  # handed back to on_switch
+
+
+class Mixer(Progress):
+    """PCM source that moves on to a pre-opened next source without a gap.
+
+    ``preload`` takes an already started Audio, so ffmpeg has spawned and
+    connected before it's needed. When the current source runs dry, frames come
+    from the preloaded one in the same read. With ``crossfade`` (ms) the two
+    are mixed linearly over the current source's last stretch. ``on_switch`` is
+    called with the preloaded tag, from the player thread, once the next source
+    becomes the current one.
+    """
+
+    def __init__(
+        self,
+        current: Audio,
+        duration: int,
+        *,
+        crossfade: int = 0,
+        on_switch: Optional[Callable[[Any], Any]] = None,
+    ):
+        self.current = current
+        self.duration = duration
+        self.crossfade = crossfade
+        self.on_switch = on_switch
+        self.next: Optional[Preloaded] = None
+        self.lock = threading.Lock()
+
+    @property
+    def done(self) -> int:  # type: ignore
+        return self.current.done
+
+    @property
+    def volume(self):
+        return self.current.volume
+
+    @volume.setter
+    def volume(self, vol: float):
+        with self.lock:
+            self.current.volume = vol
+            if self.next is not None:
+                self.next.source.volume = vol
+
+    def preload(self, source: Audio, duration: int, tag: Any = None):
+        with self.lock:
+            old, self.next = self.next, Preloaded(source, duration, tag)
+        if old is not None:
+            old.source.cleanup()
+
+    def discard(self):
+        with self.lock:
+            old, self.next = self.next, None
+        if old is not None:
+            old.source.cleanup()
+
+    def replace(self, source: Audio):
+        """Swaps the current source, e.g. to seek, returning the old one"""
+        with self.lock:
+            old, self.current = self.current, source
+        return old
+
+    def _switch(self):
+        assert self.next is not None
+        self.current.cleanup()
+        self.current, self.duration = self.next.source, self.next.duration
+        tag, self.next = self.next.tag, None
+        if self.on_switch is not None:
+            self.on_switch(tag)
+
+    @staticmethod
+    def mix(a: bytes, b: bytes, t: float) -> bytes:
+        import numpy as np  # only needed while crossfading, keep it off the startup path
+
+        x = np.frombuffer(a, dtype=np.int16).astype(np.float32)
+        y = np.frombuffer(b, dtype=np.int16).astype(np.float32)
+        if len(x) != len(y):
+            size = max(len(x), len(y))
+            x, y = np.pad(x, (0, size - len(x))), np.pad(y, (0, size - len(y)))
+        return (x * (1 - t) + y * t).clip(-32768, 32767).astype(np.int16).tobytes()
+
+    def read(self) -> bytes:
+        with self.lock:
+            start = self.duration - self.crossfade
+            if self.next is not None and self.crossfade and self.current.done >= start:
+                ours, theirs = self.current.read(), self.next.source.read()
+                if not ours:
+                    self._switch()
+                    return theirs
+                t = min((self.current.done - start) / self.crossfade, 1)
+                return self.mix(ours, theirs, t)
+            data = self.current.read()
+            if data or self.next is None:
+                return data
+            self._switch()
+            return self.current.read()
+
+    def cleanup(self):
+        self.current.cleanup()
+        self.discard()
 
 
 class Voice(VoiceClient):
+    passthrough = True  # play via OpusAudio instead of Audio
+    gapless = False  # play via a Mixer so the next track can be preloaded (PCM only)
+    crossfade = 0  # ms of overlap between gapless tracks
+    downloads = AudioCache()  # disabled until configured
+    retries = 3  # times a stream that ends early is reopened where it stopped
+    slack = 5000  # ms short of the track's duration that still counts as finished
+    default_volume = 0.5
+
     def __init__(self, *args: Any, **kwargs: Any):
         super().__init__(*args, **kwargs)
         self.lock = Lock()
         self.resumed = Event()
         self.track: Optional[Track] = None
-        self._volume: float = 0.5
+        self._volume: float = self.default_volume
+        self._stopping = False
+        self._attempts = 0
+        self._on_switch: Optional[Callable[[Track, Any], Any]] = None
+        self._sent = 0.0  # when the last frame was sent, only tracked with metrics on
+
+    def send_audio_packet(self, data: bytes, *, encode: bool = True) -> None:
+        if metrics.enabled:
+            self.pace()
+        super().send_audio_packet(data, encode=encode)
+
+    def pace(self):
+        """Counts frames and late frames per guild, on the player thread right after each read"""
+        now = time.perf_counter()
+        gap, self._sent = now - self._sent, now
+        guild = self.guild.id
+        frames.inc(guild=guild)
+        if LATE < gap < 1:  # longer gaps are pauses and track changes, not lateness
+            late_frames.inc(guild=guild)
 
     def _wrap_next(self, fn: Callable[..., Any]):
         def inner(ex: Optional[Exception] = None):
-            self.lock.release()
-            self.resumed.clear()
-            self.track = None
-            fn(ex)
+            track, source = self.track, self.source
+            if (
+                not self._stopping
+                and track is not None
+                and isinstance(source, Progress)
+                and source.done < track.duration * 1000 - self.slack
+                and self._attempts < self.retries
+            ):
+                # the stream dropped mid-track, pick it back up where it stopped
+                self._attempts += 1
+                self.loop.call_soon_threadsafe(self._reopen, source.done, fn)
+                return
+            # this runs on the player thread, asyncio primitives must be touched from the loop
+            self.loop.call_soon_threadsafe(self._finish, fn, ex)
 
         return inner
 
-    async def play(self, track: Track, *, after: Callable[[Optional[Exception]], Any]):  # type: ignore
+    def _finish(self, after: Callable[[Optional[Exception]], Any], ex: Optional[Exception]):
+        self.lock.release()
+        self.resumed.clear()
+        self.track = None
+        after(ex)
+
+    def _reopen(self, offset: int, after: Callable[[Optional[Exception]], Any]):
+        if self.track is None or not self.is_connected():
+            return self._finish(after, None)
+        source = None
+        try:
+            # a local file that ended early may have been evicted, go back to the stream
+            source = self.wrap(self.open(self.track, offset=offset, local=False), self.track)
+            super().play(source, after=self._wrap_next(after))
+        except Exception as e:  # a loop callback, nothing upstream would see this
+            if source is not None:
+                source.cleanup()
+            self._finish(after, e)
+
+    async def play(  # type: ignore
+        self,
+        track: Track,
+        *,
+        after: Callable[[Optional[Exception]], Any],
+        offset: int = 0,
+        on_switch: Optional[Callable[[Track, Any], Any]] = None,
+    ):
+        """Plays the track, calling ``after`` once playback stops.
+
+        ``on_switch`` is called on the event loop, with the track and tag passed to
+        ``preload``, whenever a preloaded track takes over without playback stopping.
+        """
         await self.lock.acquire()
         self.track = track
-        src = Audio(track.url, volume=self._volume)
-        super().play(src, after=self._wrap_next(after))
+        self._stopping = False
+        self._attempts = 0
+        self._on_switch = on_switch
+        source = None
+        try:
+            source = self.wrap(self.open(track, offset=offset), track)
+            super().play(source, after=self._wrap_next(after))
+        except BaseException:
+            # ffmpeg failed to spawn or the voice connection dropped, nothing is playing
+            if source is not None:
+                source.cleanup()
+            self.track = None
+            self.lock.release()
+            raise
         self.resumed.set()
 
+    @classmethod
+    def configure(cls, conf: MusicConfig):
+        cls.passthrough = conf.opus_passthrough
+        cls.default_volume = conf.volume
+        cls.gapless = conf.gapless
+        cls.crossfade = int(conf.crossfade * 1000)
+        cls.downloads.shutdown()
+        cls.downloads = AudioCache(
+            Path(conf.cache_dir) / "audio" if conf.audio_cache else None,
+            max_bytes=conf.audio_cache_bytes,
+            threshold=conf.audio_cache_threshold,
+        )
+
+    def open(
+        self, track: Track, *, offset: int = 0, local: bool = True
+    ) -> Union[Audio, OpusAudio]:
+        stream, opts = track.url, FFMPEG_OPTS
+        if local and (file := self.downloads.get(track.id)):
+            stream, opts = str(file), LOCAL_OPTS
+        if self.passthrough and not self.gapless:
+            return OpusAudio(
+                stream, volume=self._volume, codec=track.acodec, offset=offset, opts=opts
+            )
+        return Audio(stream, volume=self._volume, offset=offset, opts=opts)
+
+    def wrap(self, source: Union[Audio, OpusAudio], track: Track) -> AudioSource:
+        if self.gapless and isinstance(source, Audio):
+            return Mixer(
+                source,
+                int(track.duration * 1000),
+                crossfade=self.crossfade,
+                on_switch=self._switched,
+            )
+        return source
+
+    def _switched(self, tag: Any):
+        # player thread, called by the Mixer once a preloaded track is current
+        track, extra = tag
+        self.track = track
+        self._attempts = 0
+        if self._on_switch is not None:
+            self.loop.call_soon_threadsafe(self._on_switch, track, extra)
+
+    def preload(self, track: Track, tag: Any = None) -> bool:
+        """Opens the track ahead of time so it follows the current one without a gap"""
+        if not isinstance(self.source, Mixer):
+            return False
+        self.source.preload(
+            cast(Audio, self.open(track)), int(track.duration * 1000), (track, tag)
+        )
+        return True
+
+    def discard_preload(self):
+        if isinstance(self.source, Mixer):
+            self.source.discard()
+
+    def seek(self, offset: int):
+        """Restarts the current track ``offset`` ms in, without firing the track's after callback"""
+        if self.track is None or self.source is None:
+            return
+        new = self.open(self.track, offset=offset)
+        if isinstance(self.source, Mixer):
+            old = self.source.replace(cast(Audio, new))
+        else:
+            paused = self.is_paused()
+            old = self.source
+            self.source = new
+            if paused:
+                super().pause()
+        self.loop.call_later(1, old.cleanup)  # the player thread may still be mid-read on it
+
+    def stop(self) -> None:
+        self._stopping = True
+        return super().stop()
+
     def pause(self) -> None:
         self.resumed.clear()
         return super().pause()
@@ -72,7 +395,10 @@ class Voice(VoiceClient):
 
     @volume.setter
     def volume(self, vol: float):
+        if vol == self._volume:
+            return
         self._volume = vol
-        if self.source:
-            src = cast(Audio, self.source)
-            src.volume = vol
+        if isinstance(self.source, (Audio, Mixer)):
+            self.source.volume = vol
+        elif isinstance(self.source, OpusAudio):
+            self.seek(self.source.done)  # the volume is part of ffmpeg's filter chain, restart it
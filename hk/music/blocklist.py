@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import random
+from bisect import bisect_right
+from itertools import accumulate, chain, islice
+from typing import Iterable, Iterator, List, MutableSequence, Optional, TypeVar, Union, overload
+
+__all__ = ("BlockList",)
+
+T = TypeVar("T")
+
+
+class BlockList(MutableSequence[T]):
+    """List stored as a sequence of short blocks, for queues that are edited in the middle.
+
+    Indexing bisects a cached prefix sum of block lengths, and inserting or deleting
+    only moves items within one block, so everything short of ``shuffle`` costs
+    O(log n + load) instead of O(n). ``popleft`` and ``append`` make it a drop-in
+    for the deque behind ``asyncio.Queue``.
+    """
+
+    def __init__(self, iterable: Iterable[T] = (), *, load: int = 512):
+        self.load = load
+        self.blocks: List[List[T]] = []
+        self._offsets: Optional[List[int]] = []  # index of each block's first item
+        self.size = 0
+        self.extend(iterable)
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self) -> Iterator[T]:
+        return chain.from_iterable(self.blocks)
+
+    def __repr__(self):
+        return f"BlockList({list(self)!r})"
+
+    @property
+    def offsets(self):
+        if self._offsets is None:
+            self._offsets = [0, *accumulate(len(block) for block in self.blocks[:-1])]
+        return self._offsets
+
+    def locate(self, index: int) -> tuple[int, int]:
+        """Returns the block holding the item at ``index`` and its position in that block"""
+        if index < 0:
+            index += self.size
+        if not 0 <= index < self.size:
+            raise IndexError("BlockList index out of range")
+        block = bisect_right(self.offsets, index) - 1
+        return block, index - self.offsets[block]
+
+    @overload
+    def __getitem__(self, index: int) -> T:
+        ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[T]:
+        ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[T, List[T]]:
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.size)
+            if step != 1:
+                return list(self)[index]
+            return list(self.page(start, stop))
+        block, i = self.locate(index)
+        return self.blocks[block][i]
+
+    def page(self, start: int, stop: int) -> Iterator[T]:
+        """Iterates over items ``start`` to ``stop`` without walking the items before them"""
+        if start >= min(stop, self.size):
+            return iter(())
+        block, i = self.locate(start)
+        head = islice(self.blocks[block], i, None)
+        items = chain(head, chain.from_iterable(self.blocks[block + 1 :]))
+        return islice(items, stop - start)
+
+    def __setitem__(self, index: int, value: T):  # type: ignore
+        block, i = self.locate(index)
+        self.blocks[block][i] = value
+
+    def __delitem__(self, index: int):  # type: ignore
+        block, i = self.locate(index)
+        del self.blocks[block][i]
+        self.shrunk(block)
+
+    def shrunk(self, block: int):
+        self.size -= 1
+        if not self.blocks[block]:
+            del self.blocks[block]
+        self._offsets = None
+
+    def insert(self, index: int, value: T):
+        if index < 0:
+            index = max(index + self.size, 0)
+        if index >= self.size:
+            return self.append(value)
+        block, i = self.locate(index)
+        self.blocks[block].insert(i, value)
+        self.grown(block)
+
+    def grown(self, block: int):
+        self.size += 1
+        if len(self.blocks[block]) > self.load * 2:
+            half = self.blocks[block][self.load :]
+            del self.blocks[block][self.load :]
+            self.blocks.insert(block + 1, half)
+        self._offsets = None
+
+    def append(self, value: T):
+        if not self.blocks or len(self.blocks[-1]) >= self.load:
+            self.blocks.append([])
+            if self._offsets is not None:
+                self._offsets.append(self.size)
+        self.blocks[-1].append(value)
+        self.size += 1
+
+    def extend(self, values: Iterable[T]):
+        for value in values:
+            self.append(value)
+
+    def popleft(self) -> T:
+        if not self.size:
+            raise IndexError("pop from an empty BlockList")
+        value = self.blocks[0].pop(0)
+        self.shrunk(0)
+        return value
+
+    def pop(self, index: int = -1) -> T:
+        block, i = self.locate(index)
+        value = self.blocks[block].pop(i)
+        self.shrunk(block)
+        return value
+
+    def move(self, source: int, destination: int):
+        """Moves the item at ``source`` so that it ends up at ``destination``"""
+        self.insert(destination, self.pop(source))
+
+    def skip(self, count: int) -> List[T]:
+        """Removes and returns the first ``count`` items, dropping whole blocks at a time"""
+        skipped: List[T] = []
+        while self.blocks and len(skipped) + len(self.blocks[0]) <= count:
+            skipped += self.blocks.pop(0)
+        if (rest := count - len(skipped)) > 0 and self.blocks:
+            skipped += self.blocks[0][:rest]
+            del self.blocks[0][:rest]
+        self.size -= len(skipped)
+        self._offsets = None
+        return skipped
+
+    def shuffle(self):
+        items = list(self)
+        random.shuffle(items)
+        self.clear()
+        self.extend(items)
+
+    def clear(self):
+        self.blocks.clear()
+        self._offsets = []
+        self.size = 0
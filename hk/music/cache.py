@@ -0,0 +1,214 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from logging import getLogger
+from pathlib import Path
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Generic,
+    Hashable,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+__all__ = ("LRUCache", "Database", "Store", "SingleFlight")
+
+logger = getLogger("discord")
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class LRUCache(Generic[K, V]):
+    """In-memory mapping that evicts the least recently used entries past ``maxsize``.
+
+    Entries count as 1 each unless ``weigh`` is given, e.g. ``len`` to bound the
+    cache by the total size in bytes of its values.
+    """
+
+    def __init__(self, maxsize: int = 1024, *, weigh: Optional[Callable[[V], int]] = None):
+        self.maxsize = maxsize
+        self.weigh = weigh
+        self.data: OrderedDict[K, V] = OrderedDict()
+        self.weight = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key: K):
+        return key in self.data
+
+    def _weigh(self, value: V) -> int:
+        return self.weigh(value) if self.weigh else 1
+
+    def get(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        try:
+            value = self.data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: K, value: V):
+        self.pop(key)
+        self.data[key] = value
+        self.weight += self._weigh(value)
+        while self.weight > self.maxsize and len(self.data) > 1:
+            _, evicted = self.data.popitem(last=False)
+            self.weight -= self._weigh(evicted)
+            self.evictions += 1
+
+    def pop(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        if key not in self.data:
+            return default
+        value = self.data.pop(key)
+        self.weight -= self._weigh(value)
+        return value
+
+    def clear(self):
+        self.data.clear()
+        self.weight = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self.data),
+            "weight": self.weight,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class Database:
+    """Lazily opened SQLite connection, shared between threads.
+
+    Opening creates the file's directory, switches to WAL (shard processes share
+    the file) and runs ``schema``. Hold ``lock`` while using ``conn``.
+    """
+
+    def __init__(self, path: Union[str, Path], schema: str):
+        self.path = Path(path)
+        self.schema = schema
+        self.lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(self.schema)
+            self._conn = conn
+        return self._conn
+
+    def close(self):
+        with self.lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class Store(Database):
+    """Thread-safe SQLite table of JSON values, timestamped on write.
+
+    The connection is opened lazily so that merely importing a module holding a
+    ``Store`` never touches the disk. Calls block; run them with ``asyncio.to_thread``,
+    or use ``lookup`` and ``save``, which do so and treat database errors as misses.
+    """
+
+    def __init__(self, path: Union[str, Path], table: str):
+        super().__init__(
+            path,
+            f"CREATE TABLE IF NOT EXISTS {table} "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, stored REAL NOT NULL);",
+        )
+        self.table = table
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        with self.lock:
+            row = self.conn.execute(
+                f"SELECT value, stored FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def put(self, key: str, value: Any, stored: Optional[float] = None):
+        stored = time.time() if stored is None else stored
+        with self.lock:
+            self.conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, stored) VALUES (?, ?, ?)",
+                (key, json.dumps(value), stored),
+            )
+            self.conn.commit()
+
+    async def lookup(self, key: str) -> Optional[Tuple[Any, float]]:
+        try:
+            return await asyncio.to_thread(self.get, key)
+        except (sqlite3.Error, OSError) as e:  # e.g. another shard process holding the lock
+            logger.warning(f"Reading {key} from {self.path} failed: {e!r}")
+            return None
+
+    async def save(self, key: str, value: Any, stored: Optional[float] = None):
+        try:
+            await asyncio.to_thread(self.put, key, value, stored)
+        except (sqlite3.Error, OSError) as e:
+            logger.warning(f"Writing {key} to {self.path} failed: {e!r}")
+
+    def delete(self, key: str):
+        with self.lock:
+            self.conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            self.conn.commit()
+
+    def purge(self, before: float):
+        """Deletes every row stored before the given timestamp"""
+        with self.lock:
+            self.conn.execute(f"DELETE FROM {self.table} WHERE stored < ?", (before,))
+            self.conn.commit()
+
+class SingleFlight(Generic[K, V]):
+    """Coalesces concurrent calls for the same key into one shared in-flight task.
+
+    A caller being cancelled does not cancel the shared task for the others.
+    """
+
+    def __init__(self):
+        self.flights: Dict[K, asyncio.Task[V]] = {}
+        self.calls = 0
+        self.shared = 0  # calls that joined a task started by someone else
+
+    async def do(self, key: K, fn: Callable[[], Awaitable[V]]) -> V:
+        self.calls += 1
+        task = self.flights.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self.flights[key] = task
+            task.add_done_callback(lambda t: self._land(key, t))
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def _land(self, key: K, task: asyncio.Task[V]):
+        if self.flights.get(key) is task:
+            del self.flights[key]
+        if not task.cancelled():
+            task.exception()  # retrieved by the waiters, if any are left
+
+    def stats(self) -> Dict[str, int]:
+        return {"calls": self.calls, "shared": self.shared, "in_flight": len(self.flights)}
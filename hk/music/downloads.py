@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import asyncio
+import os
+from collections import Counter
+from logging import getLogger
+from pathlib import Path
+from typing import Dict, Optional
+
+from .pool import WorkerPool
+from .track import Track
+from .ytdl import youtube_dl
+
+__all__ = ("AudioCache",)
+
+logger = getLogger("discord")
+
+PARTIAL = (".part", ".ytdl")  # yt-dlp's files for downloads still in progress
+
+
+def _download(_id: str, directory: str) -> None:
+    params = {
+        "outtmpl": os.path.join(directory, "%(id)s.%(ext)s"),
+        "noplaylist": True,
+        "extract_flat": False,
+        "skip_download": False,
+    }
+    with youtube_dl(**params) as ytdl:
+        ytdl.extract_info(_id, download=True)
+
+
+class AudioCache:
+    """Opt-in, size-capped directory of downloaded audio for hot tracks.
+
+    A track is downloaded in the background once it has been played ``threshold``
+    times, or as soon as it is looping. Files are evicted least recently played
+    first (by mtime, which ``get`` bumps) once the directory exceeds ``max_bytes``.
+
+    Lookups go through an in-memory index of the directory, built by ``scan`` and
+    refreshed after every download, so playback never waits on the disk.
+    """
+
+    def __init__(
+        self,
+        path: Optional[Path] = None,
+        *,
+        max_bytes: int = 2 * 1024**3,
+        threshold: int = 3,
+        concurrency: int = 1,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.threshold = threshold
+        self.plays: Counter[str] = Counter()
+        self.files: Dict[str, Path] = {}  # video id -> downloaded file
+        self.tasks: Dict[str, asyncio.Task[None]] = {}
+        self.pool = WorkerPool("audio", size=concurrency, backlog=16, timeout=10 * 60)
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    def get(self, _id: str) -> Optional[Path]:
+        """Returns the local file for the video, if it has been downloaded"""
+        if (file := self.files.get(_id)) is not None:
+            asyncio.get_running_loop().run_in_executor(None, self.touch, _id, file)
+        return file
+
+    def touch(self, _id: str, file: Path):
+        """Marks the file recently played, blocks"""
+        try:
+            os.utime(file)  # touch() would recreate an evicted file empty
+        except FileNotFoundError:
+            # another shard process evicted it, stop handing it out
+            if self.files.get(_id) == file:
+                del self.files[_id]
+
+    def index(self):
+        """Rebuilds ``files`` from the directory, blocks"""
+        assert self.path is not None
+        if not self.path.exists():
+            self.files = {}
+            return
+        self.files = {f.stem: f for f in self.path.iterdir() if f.suffix not in PARTIAL}
+
+    async def scan(self):
+        """Indexes files downloaded before a restart"""
+        if self.enabled:
+            await asyncio.to_thread(self.index)
+
+    def played(self, track: Track, *, looping: bool = False):
+        self.plays[track.id] += 1
+        if looping or self.plays[track.id] >= self.threshold:
+            self.want(track)
+
+    def want(self, track: Track):
+        """Schedules a background download of the track unless it's already local"""
+        if not self.enabled or track.id in self.tasks or track.id in self.files:
+            return
+        task = asyncio.create_task(self.download(track))
+        task.add_done_callback(lambda _: self.tasks.pop(track.id, None))
+        self.tasks[track.id] = task
+
+    async def download(self, track: Track):
+        assert self.path is not None
+        self.path.mkdir(parents=True, exist_ok=True)
+        try:
+            await self.pool.run(_download, track.id, str(self.path))
+        except Exception as e:
+            logger.warning(f"Failed to download {track} for the audio cache: {e}")
+            return
+        await asyncio.to_thread(self.evict)
+
+    def evict(self):
+        """Deletes the least recently played files past ``max_bytes`` and re-indexes the rest"""
+        assert self.path is not None
+        files = sorted(
+            (f for f in self.path.iterdir() if f.suffix not in PARTIAL),
+            key=lambda f: f.stat().st_mtime,
+        )
+        total = sum(f.stat().st_size for f in files)
+        while files and total > self.max_bytes:
+            file = files.pop(0)
+            total -= file.stat().st_size
+            file.unlink(missing_ok=True)
+        self.files = {f.stem: f for f in files}  # also picks up other shard processes' downloads
+
+    def shutdown(self):
+        for task in self.tasks.values():
+            task.cancel()
+        self.pool.shutdown()
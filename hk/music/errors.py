@@ -35,3 +35,15 @@ class DifferentVoiceException(MusicException):
     """Raised when a user's voice channel is different from the bot's"""
 
     message = "You need to be in the same voice channel as the bot!"
+
+
+class BusyException(MusicException):
+    """Raised when a worker pool's backlog is full"""
+
+    message = "I'm a little busy right now, try again in a bit!"
+
+
+class WorkerTimeoutException(MusicException):
+    """Raised when a worker pool job takes longer than its timeout"""
+
+    message = "That took too long, try again later!"
@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import time
+from bisect import bisect_left, insort
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+from .track import BasePlaylist, BaseTrack
+
+__all__ = ("TitleIndex", "IndexEntry")
+
+
+@dataclass
+class IndexEntry:
+    id: str
+    title: str
+    value: str  # submitted as the command's query when picked
+    tokens: Tuple[str, ...]
+    plays: int = 0
+    seen: float = field(default_factory=time.time)
+
+
+def tokenize(text: str) -> Tuple[str, ...]:
+    return tuple(dict.fromkeys(text.casefold().split()))
+
+
+class TitleIndex:
+    """Bounded in-memory prefix index over titles the bot has already resolved.
+
+    Lookups are a bisect over a sorted token list, so they never touch the
+    network. Past ``size`` titles the least recently seen one is dropped, and
+    per-guild play history keeps at most ``history`` tracks per guild.
+    """
+
+    def __init__(self, size: int = 5000, *, history: int = 500):
+        self.size = size
+        self.history = history
+        self.entries: OrderedDict[str, IndexEntry] = OrderedDict()
+        self.tokens: List[Tuple[str, str]] = []  # sorted (token, id) pairs
+        self.plays: Dict[int, Counter[str]] = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, item: Union[BaseTrack, BasePlaylist]):
+        _id = str(item.id)
+        if entry := self.entries.get(_id):
+            entry.seen = time.time()
+            self.entries.move_to_end(_id)
+            return
+        if isinstance(item, BasePlaylist):
+            value = f"https://www.youtube.com/playlist?list={_id}"
+        else:
+            value = f"https://youtu.be/{_id}"
+        entry = IndexEntry(_id, item.title, value, tokenize(item.title))
+        self.entries[_id] = entry
+        for token in entry.tokens:
+            insort(self.tokens, (token, _id))
+        while len(self.entries) > self.size:
+            self.remove(next(iter(self.entries)))
+
+    def remove(self, _id: str):
+        if entry := self.entries.pop(_id, None):
+            for token in entry.tokens:
+                i = bisect_left(self.tokens, (token, _id))
+                if i < len(self.tokens) and self.tokens[i] == (token, _id):
+                    del self.tokens[i]
+
+    def played(self, guild: int, track: BaseTrack):
+        self.add(track)
+        _id = str(track.id)
+        if entry := self.entries.get(_id):  # not when the index is too small to hold it
+            entry.plays += 1
+        counter = self.plays.setdefault(guild, Counter())
+        counter[_id] += 1
+        if len(counter) > self.history:
+            self.plays[guild] = Counter(dict(counter.most_common(self.history // 2)))
+
+    def prefixed(self, prefix: str) -> Set[str]:
+        """Returns ids of titles with a word starting with ``prefix``"""
+        ids: Set[str] = set()
+        i = bisect_left(self.tokens, (prefix, ""))
+        while i < len(self.tokens) and self.tokens[i][0].startswith(prefix):
+            ids.add(self.tokens[i][1])
+            i += 1
+        return ids
+
+    def search(self, query: str, *, guild: Optional[int] = None, limit: int = 25):
+        """Titles matching every word of the query as a prefix, most played first"""
+        words = tokenize(query)
+        history = self.plays.get(guild, Counter()) if guild is not None else Counter()
+        if words:
+            ids = self.prefixed(max(words, key=len))
+            entries = [
+                self.entries[_id]
+                for _id in ids
+                if all(any(t.startswith(w) for t in self.entries[_id].tokens) for w in words)
+            ]
+        else:
+            entries = [self.entries[_id] for _id in history if _id in self.entries]
+        entries.sort(key=lambda e: (history[e.id] * 2 + e.plays, e.seen), reverse=True)
+        return entries[:limit]
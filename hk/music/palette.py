@@ -0,0 +1,47 @@
+from typing import List, Tuple
+
+import numpy as np
+from PIL import Image
+
+__all__ = ("quantize",)
+
+RGB = Tuple[int, int, int]
+MERGE = 32  # colours closer than this (euclidean, in RGB) count together for dominance
+
+
+def quantize(image: Image.Image, count: int = 15, *, size: int = 64) -> Tuple[RGB, List[RGB]]:
+    """Vectorised median cut over a ``size``x``size`` downsample of the image.
+
+    Returns the dominant colour and up to ``count`` palette colours. Median cut
+    yields boxes of equal population, so every pixel is then assigned to its
+    nearest box colour (one k-means step) to rank colours by what they cover.
+    """
+    small = image.convert("RGB").resize((size, size), Image.Resampling.BILINEAR)
+    pixels = np.asarray(small, dtype=np.uint8).reshape(-1, 3)
+    boxes = [pixels]
+    while len(boxes) < count:
+        ranges = [np.ptp(box, axis=0) for box in boxes]
+        scores = [int(r.max()) * len(box) for r, box in zip(ranges, boxes)]
+        i = int(np.argmax(scores))
+        if scores[i] == 0:  # every box is a single colour
+            break
+        box = boxes.pop(i)
+        half = len(box) // 2
+        order = np.argpartition(box[:, int(ranges[i].argmax())], half)
+        boxes += [box[order[:half]], box[order[half:]]]
+
+    centres = np.array([box.mean(axis=0) for box in boxes])
+    distances = ((pixels[:, None, :].astype(np.float32) - centres[None]) ** 2).sum(axis=2)
+    nearest = distances.argmin(axis=1)
+    counts = np.bincount(nearest, minlength=len(centres))
+    sums = np.zeros_like(centres)
+    np.add.at(sums, nearest, pixels)
+    used = counts > 0
+    centres[used] = sums[used] / counts[used, None]
+    ranked = np.argsort(-counts)
+    colors: List[RGB] = [tuple(int(c) for c in centres[i]) for i in ranked if counts[i]]  # type: ignore
+
+    # a large flat area may have been cut into several near-identical boxes, pool them
+    near = ((centres[:, None, :] - centres[None]) ** 2).sum(axis=2) < MERGE**2
+    dominant = centres[int((near * counts[None]).sum(axis=1).argmax())]
+    return tuple(int(c) for c in dominant), colors  # type: ignore
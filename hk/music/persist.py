@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from dataclasses import dataclass, field
+from logging import getLogger
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+
+from .cache import Database
+from .track import BaseTrack, Track
+
+if TYPE_CHECKING:
+    from .queue import Queue
+
+__all__ = ("QueueJournal", "QueueState")
+
+logger = getLogger("discord")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    guild INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_guild ON events (guild, id);
+CREATE TABLE IF NOT EXISTS snapshots (
+    guild INTEGER PRIMARY KEY,
+    data TEXT NOT NULL
+);
+"""
+
+
+def dump(track: BaseTrack) -> Dict[str, Any]:
+    return {"full": isinstance(track, Track), **track.dict()}
+
+
+def load(data: Dict[str, Any]) -> BaseTrack:
+    full = data.pop("full", False)
+    return Track(**data) if full else BaseTrack(**data)
+
+
+@dataclass
+class QueueState:
+    """A guild's queue as it was last journaled"""
+
+    guild: int
+    tracks: List[BaseTrack] = field(default_factory=list)
+    voice: Optional[int] = None  # channel ids
+    bound: Optional[int] = None
+    track: Optional[Track] = None  # playing when snapshotted
+    position: int = 0  # ms into ``track``
+    repeating: bool = False
+    volume: Optional[float] = None  # the voice client's default when never snapshotted
+
+
+class QueueJournal:
+    """Checkpoints queues to SQLite so they survive restarts.
+
+    Queue changes are appended as events (add, drop, move, reset) and the playing track
+    and its position are snapshotted every ``interval`` seconds. Both are buffered
+    in memory and written in one transaction on a worker thread, so the database is
+    never on the playback path. Disabled (every call a no-op) without a path.
+    """
+
+    def __init__(self, path: Optional[Path] = None, *, interval: float = 5):
+        self.path = path
+        self.interval = interval
+        self.events: List[Tuple[int, str, str]] = []
+        self.queues: Dict[int, Queue] = {}
+        self.forgotten: List[int] = []
+        self.task: Optional[asyncio.Task[None]] = None
+        self.db = Database(path, SCHEMA) if path else None
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    def record(self, guild: int, kind: str, data: Any = None):
+        if self.enabled:
+            self.events.append((guild, kind, json.dumps(data)))
+
+    def add(self, guild: int, track: BaseTrack):
+        self.record(guild, "add", dump(track))
+
+    def drop(self, guild: int, index: int = 0, count: int = 1):
+        self.record(guild, "drop", [index, count])
+
+    def move(self, guild: int, source: int, destination: int):
+        self.record(guild, "move", [source, destination])
+
+    def reset(self, guild: int, tracks: List[BaseTrack]):
+        """Replaces the journaled queue, e.g. after a reorder"""
+        self.record(guild, "reset", [dump(track) for track in tracks])
+
+    def watch(self, queue: Queue):
+        """Snapshots the queue's playback position until it's forgotten"""
+        if not self.enabled:
+            return
+        self.queues[queue.guild.id] = queue
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    def forget(self, guild: int):
+        if self.enabled:
+            self.queues.pop(guild, None)
+            self.events = [event for event in self.events if event[0] != guild]
+            self.forgotten.append(guild)
+
+    @staticmethod
+    def snapshot(queue: Queue) -> Optional[Dict[str, Any]]:
+        voice = queue.guild.voice_client
+        if voice is None:
+            return None
+        track, source = queue.voice.track, queue.source
+        return {
+            "voice": voice.channel.id,  # type: ignore
+            "bound": queue.bound.id,  # type: ignore
+            "track": dump(track) if track else None,
+            "position": source.done if track and source else 0,
+            "repeating": queue.repeating,
+            "volume": queue.voice.volume,
+        }
+
+    async def run(self):
+        while self.queues or self.events or self.forgotten:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    async def flush(self):
+        if not self.enabled:
+            return
+        events, self.events = self.events, []
+        forgotten, self.forgotten = self.forgotten, []
+        snapshots = {
+            guild: snapshot
+            for guild, queue in self.queues.items()
+            if (snapshot := self.snapshot(queue)) is not None
+        }
+        try:
+            await asyncio.to_thread(self.write, events, snapshots, forgotten)
+        except Exception as e:
+            logger.error(f"Failed to checkpoint queues: {e}")
+
+    def write(
+        self,
+        events: List[Tuple[int, str, str]],
+        snapshots: Dict[int, Dict[str, Any]],
+        forgotten: List[int],
+    ):
+        assert self.db is not None
+        with self.db.lock, self.db.conn as conn:
+            for guild in forgotten:
+                conn.execute("DELETE FROM events WHERE guild = ?", (guild,))
+                conn.execute("DELETE FROM snapshots WHERE guild = ?", (guild,))
+            conn.executemany(
+                "INSERT INTO events (guild, kind, data) VALUES (?, ?, ?)", events
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO snapshots (guild, data) VALUES (?, ?)",
+                [(guild, json.dumps(data)) for guild, data in snapshots.items()],
+            )
+
+    def read(self, owns: Callable[[int], bool]) -> Dict[int, QueueState]:
+        """Replays the journal into queue states, then compacts each guild to one reset event.
+
+        Only guilds passing ``owns`` are read, other shard processes own the rest.
+        """
+        states: Dict[int, QueueState] = {}
+        assert self.db is not None
+        with self.db.lock, self.db.conn as conn:
+            for guild, kind, data in conn.execute(
+                "SELECT guild, kind, data FROM events ORDER BY id"
+            ):
+                if not owns(guild):
+                    continue
+                state = states.setdefault(guild, QueueState(guild))
+                data = json.loads(data)
+                if kind == "add":
+                    state.tracks.append(load(data))
+                elif kind == "drop":
+                    index, count = data
+                    del state.tracks[index : index + count]
+                elif kind == "move":
+                    source, destination = data
+                    state.tracks.insert(destination, state.tracks.pop(source))
+                elif kind == "reset":
+                    state.tracks = [load(track) for track in data]
+            for guild, data in conn.execute("SELECT guild, data FROM snapshots"):
+                if not owns(guild):
+                    continue
+                state = states.setdefault(guild, QueueState(guild))
+                data = json.loads(data)
+                state.voice, state.bound = data["voice"], data["bound"]
+                state.track = load(data["track"]) if data["track"] else None  # type: ignore
+                state.position = data["position"]
+                state.repeating = data["repeating"]
+                state.volume = data["volume"]
+            conn.executemany("DELETE FROM events WHERE guild = ?", [(g,) for g in states])
+            conn.executemany(
+                "INSERT INTO events (guild, kind, data) VALUES (?, 'reset', ?)",
+                [
+                    (guild, json.dumps([dump(track) for track in state.tracks]))
+                    for guild, state in states.items()
+                ],
+            )
+        return states
+
+    async def load(self, owns: Callable[[int], bool] = lambda _: True) -> Dict[int, QueueState]:
+        if not self.enabled:
+            return {}
+        return await asyncio.to_thread(self.read, owns)
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+from concurrent.futures import (
+    BrokenExecutor,
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from multiprocessing import get_context
+from typing import Any, Callable, Literal, Optional, TypeVar
+
+from .errors import BusyException, WorkerTimeoutException
+
+__all__ = ("WorkerPool",)
+
+T = TypeVar("T")
+
+local = threading.local()  # long-lived per-worker state, created by pool initializers
+
+# raised by WorkerPool.run when the pool is overloaded or restarting, worth retrying later
+TRANSIENT = (BusyException, WorkerTimeoutException, BrokenExecutor)
+
+
+class WorkerPool:
+    """Dedicated executor for blocking work with a bounded backlog and per-call timeouts.
+
+    ``initializer`` runs once in every worker thread or process and should stash
+    whatever the jobs reuse (e.g. a YoutubeDL instance) on ``local``. Workers are
+    started lazily on the first job.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        kind: Literal["thread", "process"] = "thread",
+        size: int = 4,
+        backlog: int = 32,
+        timeout: Optional[float] = 30,
+        initializer: Optional[Callable[[], Any]] = None,
+    ):
+        self.name = name
+        self.kind = kind
+        self.size = size
+        self.backlog = backlog
+        self.timeout = timeout
+        self.initializer = initializer
+        self.pending = 0  # jobs queued or running, including ones whose caller timed out
+        self.lock = threading.Lock()
+        self._executor: Optional[Executor] = None
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                # spawn rather than fork, the bot process has live threads (event loop, voice players)
+                self._executor = ProcessPoolExecutor(
+                    self.size, mp_context=get_context("spawn"), initializer=self.initializer
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    self.size, thread_name_prefix=self.name, initializer=self.initializer
+                )
+        return self._executor
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        """Runs ``fn(*args)`` on a worker, failing fast when the backlog is full.
+
+        A job counts as pending until its worker is actually done with it, not just
+        until the caller stops waiting, so hung jobs keep the backlog full.
+        """
+        with self.lock:
+            if self.pending >= self.size + self.backlog:
+                raise BusyException
+            self.pending += 1
+        executor = self.executor
+        try:
+            job = executor.submit(fn, *args)
+        except BaseException:
+            self._done()
+            if self._executor is executor:
+                self._executor = None  # broken or shut down, start a fresh pool on the next job
+            raise
+        job.add_done_callback(self._done)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(job), self.timeout)
+        except asyncio.TimeoutError:
+            if self.kind == "process":
+                self.recycle(executor)  # the worker may be stuck for good, kill it
+            raise WorkerTimeoutException
+        except BrokenExecutor:
+            if self._executor is executor:
+                self._executor = None  # a worker process died, start a fresh pool on the next job
+            raise
+
+    def _done(self, job: Optional[Future[Any]] = None):
+        # called from whichever thread finished the job
+        with self.lock:
+            self.pending -= 1
+
+    def recycle(self, executor: Executor):
+        """Replaces a process pool, killing its workers along with whatever they're running.
+
+        Other jobs still running on it fail with BrokenExecutor, which callers retry.
+        """
+        if self._executor is executor:
+            self._executor = None
+        # ProcessPoolExecutor has no public handle on its workers
+        processes = list((getattr(executor, "_processes", None) or {}).values())
+        executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.kill()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
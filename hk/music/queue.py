@@ -1,68 +1,326 @@
 from __future__ import annotations
 
 import asyncio
-from collections import deque
-from typing import Any, List, Optional, Union, cast
+import heapq
+import time
+from dataclasses import dataclass
+from itertools import count
+from logging import getLogger
+from pathlib import Path
+from typing import Any, Coroutine, Dict, List, Optional, Set, Tuple, Union, cast
 
-from discord import Message
+from discord import HTTPException, Message, RateLimited
 
 from ..bot import Bot
+from ..metrics import metrics
 from ..protocols import GuildMessageable
-from .audio import Audio, Voice
-from .errors import NoVoiceException, UnknownTrackException
-from .track import BasePlaylist, BaseTrack
+from ..settings import MusicConfig
+from .audio import Progress, Voice
+from .blocklist import BlockList
+from .errors import MusicException, NoVoiceException, UnknownTrackException
+from .persist import QueueJournal, QueueState
+from .pool import TRANSIENT
+from .track import BasePlaylist, BaseTrack, Track
 from .ytdl import YTDL
 
+logger = getLogger("discord")
 
-class UpdaterTask:
-    def __init__(self, message: Message, *, queue: Queue, buffer: int = 10):
-        self.message = message
-        self.buffer = buffer
-        self.queue = queue
-        self.task = asyncio.create_task(self.updater())
-
-    async def updater(self) -> None:
-        while True:
-            await asyncio.sleep(self.buffer)
-            await self.queue.voice.resumed.wait()  # only update when a track is playing
-            embed = self.message.embeds[0]
-            embed.set_footer(text=self.queue.progress)
-            try:
-                await self.message.edit(
-                    embed=embed, attachments=self.message.attachments
-                )
-            except Exception:
-                await self.stop()
-                break
+PRELOAD_LEAD = 10  # seconds before the end of a track to open the next one
+RETRIES = 3  # attempts at resolving a track while the worker pools are overloaded
+
+gaps = metrics.histogram(
+    "hk_track_gap_seconds", "Time from one track ending to the next one starting"
+)
+
+
+@dataclass
+class NowPlaying:
+    """A now playing message whose footer tracks its queue's progress"""
+
+    message: Message
+    queue: Queue
+    due: float = 0
+    footer: Optional[str] = None  # last footer sent
+    editing: bool = False  # at most one edit per message is ever in flight
+    urgent: bool = False  # a state change wants showing as soon as the channel allows
+
+
+class ProgressScheduler:
+    """Refreshes every now playing message from a single task.
+
+    Messages wait in a heap ordered by when they're next due. A message isn't
+    edited when nothing is playing or its footer text is unchanged, and edits
+    to the same channel are spaced ``spacing`` seconds apart to stay inside
+    Discord's per-channel rate limit.
+    """
 
-    async def stop(self):
+    def __init__(self, *, interval: float = 10, spacing: float = 1):
+        self.interval = interval
+        self.spacing = spacing
+        self.heap: List[Tuple[float, int, int]] = []  # (due, tiebreak, message id)
+        self.messages: Dict[int, NowPlaying] = {}
+        self.channels: Dict[int, float] = {}  # channel id -> earliest next edit
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task[None]] = None
+        self.counter = count()
+        self.pending: Set[asyncio.Task[None]] = set()  # edits and deletes in flight
+
+    def spawn(self, coro: Coroutine[Any, Any, None]):
+        task = asyncio.create_task(coro)
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+
+    def schedule(self, np: NowPlaying, due: float):
+        np.due = due
+        heapq.heappush(self.heap, (due, next(self.counter), np.message.id))
+        self.wakeup.set()
+
+    def add(self, message: Message, queue: Queue):
+        np = NowPlaying(message, queue, footer=queue.progress)
+        self.messages[message.id] = np
+        self.schedule(np, time.monotonic() + self.interval)
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    def release(self, queue: Queue):
+        """Stops tracking the queue's messages and deletes them"""
+        for np in [np for np in self.messages.values() if np.queue is queue]:
+            del self.messages[np.message.id]
+            self.spawn(self.delete(np.message))
+
+    @staticmethod
+    async def delete(message: Message):
         try:
-            await self.message.delete()
+            await message.delete()
         except Exception:
             pass
+
+    async def run(self):
+        while self.messages:
+            self.wakeup.clear()
+            now = time.monotonic()
+            while self.heap and self.heap[0][0] <= now:
+                due, _, _id = heapq.heappop(self.heap)
+                np = self.messages.get(_id)
+                if np is not None and np.due == due:  # otherwise released or rescheduled
+                    self.refresh(np, now)
+            timeout = self.heap[0][0] - now if self.heap else None
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def request(self, queue: Queue):
+        """Refreshes the queue's messages right away, e.g. after a pause or volume change.
+
+        Requests landing while an edit is in flight are merged into a single follow-up edit.
+        """
+        now = time.monotonic()
+        for np in self.messages.values():
+            if np.queue is queue:
+                np.urgent = True
+                if not np.editing:
+                    self.schedule(np, now)
+
+    def refresh(self, np: NowPlaying, now: float):
+        channel = np.message.channel.id
+        if np.editing:  # edit() reschedules when it lands if anything urgent came up
+            return self.schedule(np, now + self.interval)
+        if (ready := self.channels.get(channel, 0)) > now:
+            return self.schedule(np, ready)
+        urgent, np.urgent = np.urgent, False
+        try:
+            live = urgent or np.queue.voice.resumed.is_set()
+            footer = np.queue.progress if live else np.footer
+        except MusicException:
+            footer = np.footer
+        if footer != np.footer:
+            np.footer = footer
+            np.editing = True
+            self.channels[channel] = now + self.spacing
+            self.spawn(self.edit(np, footer))
+        self.schedule(np, now + self.interval)
+
+    async def edit(self, np: NowPlaying, footer: Optional[str]):
+        embed = np.message.embeds[0]
+        embed.set_footer(text=footer)
+        retry = None
+        try:
+            await np.message.edit(embed=embed)  # attachments are kept when not passed
+        except RateLimited as e:
+            retry = e.retry_after
+        except HTTPException as e:
+            if e.status == 429:
+                retry = float(e.response.headers.get("Retry-After", self.spacing))
+            elif self.messages.pop(np.message.id, None) is not None:
+                await self.delete(np.message)
+        except Exception:
+            if self.messages.pop(np.message.id, None) is not None:
+                await self.delete(np.message)
         finally:
-            self.task.cancel()
+            np.editing = False
+        if retry is not None:  # back off the whole channel, then resend this state
+            channel = np.message.channel.id
+            self.channels[channel] = max(self.channels.get(channel, 0), time.monotonic() + retry)
+            np.footer, np.urgent = None, True
+        if np.urgent and np.message.id in self.messages:
+            self.schedule(np, time.monotonic())
+
+
+class Prefetcher:
+    """Resolves the next few partials into Tracks, and renders their banners, while the current track plays"""
+
+    def __init__(self, queue: Queue, *, depth: int = 2, concurrency: int = 2):
+        self.queue = queue
+        self.depth = depth
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.tasks: Dict[str, asyncio.Task[Track]] = {}
+
+    def refresh(self):
+        """Starts work for the head of the queue and cancels work for tracks no longer in it"""
+        upcoming = list(self.queue.tracks.page(0, self.depth))
+        ids = {str(partial.id) for partial in upcoming}
+        for key in [key for key in self.tasks if key not in ids]:
+            self.tasks.pop(key).cancel()
+        for partial in upcoming:
+            key = str(partial.id)
+            if key not in self.tasks:
+                task = asyncio.create_task(self.fetch(partial))
+                task.add_done_callback(self._consume)
+                self.tasks[key] = task
+
+    @staticmethod
+    def _consume(task: asyncio.Task[Track]):
+        # failures are re-raised by resolve(); don't let unused ones be logged as never retrieved
+        if not task.cancelled():
+            task.exception()
+
+    async def fetch(self, partial: BaseTrack) -> Track:
+        async with self.semaphore:
+            track = await YTDL.to_track(partial)
+            try:
+                await track.create_banner(self.queue.bot.session)
+            except Exception as e:
+                logger.warning(f"Failed to prefetch banner for {track}: {e}")
+            return track
+
+    async def resolve(self, partial: BaseTrack) -> Track:
+        """Returns the prefetched Track for the partial, resolving it now if it wasn't prefetched"""
+        if task := self.tasks.pop(str(partial.id), None):
+            await asyncio.wait((task,))
+            if not task.cancelled():
+                return task.result()
+        return await YTDL.to_track(partial)
+
+    def cancel(self):
+        for task in self.tasks.values():
+            task.cancel()
+        self.tasks.clear()
 
 
 class Queue(asyncio.Queue[BaseTrack]):
+    scheduler = ProgressScheduler()
+    journal = QueueJournal()
+
     def __init__(self, bot: Bot, *, bound: GuildMessageable):
         super().__init__()
-        self.deque: deque[BaseTrack] = self._queue  # type: ignore
+        self.tracks: BlockList[BaseTrack] = self._queue  # type: ignore
         self.guild = bound.guild
         self.bound = bound
         self.loop = asyncio.get_running_loop()
         self.bot = bot
-        self.updater_tasks: List[UpdaterTask] = []
         self.repeating = False
+        self.advancing = False  # set while next() is between get() and play()
+        self.conf = bot.conf.music
+        self.prefetcher = Prefetcher(
+            self, depth=self.conf.prefetch, concurrency=self.conf.prefetch_concurrency
+        )
+        self.loader: Optional[asyncio.Task[None]] = None  # the newest playlist load
+        self.loaders: Set[asyncio.Task[None]] = set()  # every load still running, chained in order
+        self.preloader: Optional[asyncio.Task[None]] = None
+        self.journaling = True  # off while restoring, the tracks are journaled already
+        self.version = 0  # bumped on every change to the upcoming tracks
+        self.failures = 0  # tracks that failed to start in a row
+
+    @classmethod
+    def configure(cls, conf: MusicConfig):
+        cls.journal = QueueJournal(
+            Path(conf.cache_dir) / "queues.sqlite3" if conf.persist_queues else None,
+            interval=conf.checkpoint_interval,
+        )
+
+    def _init(self, maxsize: int):
+        self._queue = BlockList()
+
+    def _put(self, item: BaseTrack):
+        super()._put(item)
+        self.version += 1
+        if self.journaling:
+            self.journal.add(self.guild.id, item)
+
+    def _get(self) -> BaseTrack:
+        item = super()._get()
+        self.version += 1
+        self.journal.drop(self.guild.id)
+        return item
+
+    @property
+    def idle(self):
+        return not self.voice.track and not self.advancing
 
     async def next(self) -> Any:
-        self._cancel_tasks()
+        self.scheduler.release(self)
+        self.advancing = True
+        waiting, start = self.empty(), time.perf_counter()  # empty: waiting on users, not us
+        partial: Optional[BaseTrack] = None
         try:
             partial = await self.get()
-            track = await YTDL.to_track(partial)
-        except UnknownTrackException:
-            return self._next()
-        await self.voice.play(track, after=self._next)
+            track = await self.resolve(partial)
+            await self.voice.play(track, after=self._next, on_switch=self._switched)
+        except Exception as e:
+            return self.failed(partial, e)
+        except BaseException:
+            self.advancing = False
+            raise
+        self.advancing = False
+        self.failures = 0
+        if metrics.enabled and not waiting:
+            gaps.observe(time.perf_counter() - start)
+        await self.started(track)
+
+    async def resolve(self, partial: BaseTrack) -> Track:
+        """Resolves the partial, backing off and retrying while the worker pools are overloaded"""
+        for attempt in range(RETRIES):
+            try:
+                return await self.prefetcher.resolve(partial)
+            except TRANSIENT as e:
+                if attempt == RETRIES - 1:
+                    raise
+                logger.warning(f"Retrying {partial.id} in {self.guild}: {e!r}")
+                await asyncio.sleep(2**attempt)
+        raise AssertionError("unreachable")
+
+    def failed(self, partial: Optional[BaseTrack], e: Exception):
+        """Moves past a track that couldn't be started, so the rest of the queue still plays"""
+        if isinstance(e, NoVoiceException):
+            self.advancing = False  # disconnected, there's nothing to play into
+            return
+        if not isinstance(e, UnknownTrackException):
+            logger.error(f"Skipping {partial and partial.id} in {self.guild}: {e!r}")
+        self.failures += 1
+        if self.repeating and self.failures > self.qsize():  # every looped track failed
+            logger.error(f"Stopping the queue in {self.guild} after {self.failures} failures")
+            self.advancing, self.failures = False, 0
+            return
+        self._next()  # still advancing, the scheduled next() takes over
+
+    async def started(self, track: Track):
+        """Bookkeeping and the now playing message for a track that just began"""
+        self.prefetcher.refresh()
+        self.schedule_preload()
+        self.journal.watch(self)
+        YTDL.index.played(self.guild.id, track)
+        self.voice.downloads.played(track, looping=self.repeating)
 
         banner = await track.create_banner(self.bot.session)
         message = await self.bound.send(
@@ -70,14 +328,93 @@ class Queue(asyncio.Queue[BaseTrack]):
         )
         self.add_updater(message)
 
+    async def restore(self, state: QueueState):
+        """Picks a journaled queue back up, resuming its track where it was last checkpointed"""
+        self.repeating = state.repeating
+        if state.volume is not None:
+            self.voice.volume = state.volume
+        self.journaling = False
+        try:
+            for partial in state.tracks:
+                self.put_nowait(partial)
+        finally:
+            self.journaling = True
+        if state.track is None:
+            if not self.empty():
+                await self.next()
+            return
+        self.advancing = True
+        try:
+            track = await self.resolve(state.track)  # the stream URL has likely expired
+            await self.voice.play(
+                track, after=self._next, offset=state.position, on_switch=self._switched
+            )
+        except Exception as e:
+            return self.failed(state.track, e)
+        except BaseException:
+            self.advancing = False
+            raise
+        self.advancing = False
+        await self.started(track)
+
     def _next(self, exception: Optional[Exception] = None):
         self.loop.create_task(self.next())
 
-    def _cancel_tasks(self):
-        asyncio.gather(*[task.stop() for task in self.updater_tasks])
+    def _switched(self, track: Track, partial: BaseTrack):
+        # a preloaded track took over in the voice mixer, catch the queue up
+        if self.tracks and self.tracks[0] is partial:
+            self.get_nowait()
+            if self.repeating:
+                self.put_nowait(partial)
+        self.scheduler.release(self)
+        self.loop.create_task(self.started(track))
+
+    def schedule_preload(self):
+        if not self.voice.gapless:
+            return
+        if self.preloader is not None:
+            self.preloader.cancel()
+        self.voice.discard_preload()
+        self.preloader = asyncio.create_task(self.preload())
+
+    async def preload(self):
+        """Hands the head of the queue to the voice mixer shortly before the current track ends.
+
+        Preloading any earlier would leave the next stream's connection idle for most of a track.
+        """
+        voice = self.voice
+        lead = PRELOAD_LEAD + voice.crossfade / 1000
+        while (current := voice.track) and (src := self.source):
+            remaining = current.duration - src.seconds() - lead
+            if remaining <= 0:
+                break
+            await asyncio.sleep(min(remaining, 5))
+        if not self.tracks or not voice.track:
+            return
+        partial = self.tracks[0]
+        try:
+            track = await YTDL.to_track(partial)
+        except MusicException:
+            return  # next() will deal with it once the current track ends
+        if self.tracks and self.tracks[0] is partial:
+            voice.preload(track, partial)
+
+    def close(self):
+        """Cancels all background work, used when the queue is discarded"""
+        self.prefetcher.cancel()
+        for loader in self.loaders:  # each waits on the one before, cancel the whole chain
+            loader.cancel()
+        if self.preloader is not None:
+            self.preloader.cancel()
+        self.scheduler.release(self)
+        self.journal.forget(self.guild.id)
 
     def add_updater(self, message: Message):
-        self.updater_tasks.append(UpdaterTask(message, queue=self))
+        self.scheduler.add(message, self)
+
+    def refresh(self):
+        """Shows a state change (pause, loop, volume, seek) on now playing messages right away"""
+        self.scheduler.request(self)
 
     @property
     def voice(self):
@@ -89,17 +426,79 @@ class Queue(asyncio.Queue[BaseTrack]):
 
     @property
     def source(self):
-        return cast(Optional[Audio], self.voice.source)
+        return cast(Optional[Progress], self.voice.source)
 
     async def put(self, item: Union[BaseTrack, BasePlaylist]):
         empty = self.empty()
         if isinstance(item, BasePlaylist):
+            if self.conf.eager_playlists:
+                self.loader = asyncio.create_task(self.load(item, after=self.loader))
+                self.loaders.add(self.loader)
+                self.loader.add_done_callback(self._loaded)
+                return
             for track in item.entries:
                 self.put_nowait(track)
         else:
             await super().put(item)
-        if not self.voice.track and empty:
+        if self.idle:  # also picks a queue back up after next() gave up on it
             await self.next()
+        else:
+            self.prefetcher.refresh()
+            if empty:
+                self.schedule_preload()  # the track after the current one just changed
+
+    async def load(
+        self, playlist: BasePlaylist, *, after: Optional[asyncio.Task[None]] = None
+    ):
+        """Streams resolved playlist entries into the queue as each batch completes"""
+        if after is not None:
+            await asyncio.wait((after,))  # keep playlists queued back to back in order
+        async for track in YTDL.resolve(playlist.entries, batch=self.conf.playlist_batch):
+            self.put_nowait(track)
+            if self.idle:
+                self.advancing = True
+                self._next()
+            elif self.qsize() == 1:
+                self.schedule_preload()
+        self.prefetcher.refresh()
+
+    def _loaded(self, task: asyncio.Task[None]):
+        self.loaders.discard(task)
+        if not task.cancelled() and (e := task.exception()) is not None:
+            logger.error(f"Failed to load a playlist in {self.guild}: {e!r}", exc_info=e)
+
+    def skip(self, count: int) -> List[BaseTrack]:
+        """Removes and returns the next ``count`` tracks"""
+        skipped = self.tracks.skip(count)
+        if skipped:
+            self.journal.drop(self.guild.id, 0, len(skipped))
+            self.changed(head=True)
+        return skipped
+
+    def remove(self, index: int) -> BaseTrack:
+        track = self.tracks.pop(index)
+        self.journal.drop(self.guild.id, index)
+        self.changed(head=index < self.prefetcher.depth)
+        return track
+
+    def move(self, source: int, destination: int) -> BaseTrack:
+        track = self.tracks[source]
+        self.tracks.move(source, destination)
+        self.journal.move(self.guild.id, source, destination)
+        self.changed(head=min(source, destination) < self.prefetcher.depth)
+        return track
+
+    def shuffle(self):
+        self.tracks.shuffle()
+        self.journal.reset(self.guild.id, list(self.tracks))
+        self.changed(head=True)
+
+    def changed(self, *, head: bool):
+        """Catches background work up with a reordered queue"""
+        self.version += 1
+        if head:
+            self.prefetcher.refresh()
+            self.schedule_preload()  # the preloaded track may no longer be next
 
     async def get(self):
         track = await super().get()
@@ -113,6 +512,7 @@ class Queue(asyncio.Queue[BaseTrack]):
         if (track := self.voice.track) and (src := self.source):
             pct = int(src.seconds() * 100 // track.duration)
             progress = f"{src.seconds()/60:.2f}/{track.runtime} | {pct}%"
+            progress += f" | Volume {self.voice.volume:.0%}"
             if self.voice.is_paused():
                 progress += "\nPaused"
             if self.repeating:
@@ -124,5 +524,10 @@ class Queue(asyncio.Queue[BaseTrack]):
     def repeat(self):
         self.repeating = not self.repeating
         if track := self.voice.track:
+            empty = self.empty()
             self.put_nowait(track)
+            if self.repeating:
+                self.voice.downloads.want(track)
+            if empty:
+                self.schedule_preload()
         return self.repeating
@@ -0,0 +1,80 @@
+from io import BytesIO
+from textwrap import wrap
+from typing import Tuple
+
+from PIL import Image, ImageDraw, ImageFont
+
+from .palette import RGB, quantize
+from .pool import local
+
+__all__ = ("load_fonts", "render")
+
+
+def load_fonts(normal: str = "static/font.otf", bold: str = "static/bold.otf"):
+    """Pool initializer, loads the banner fonts once per worker"""
+    local.fonts = ImageFont.truetype(normal, 20), ImageFont.truetype(bold, 40)
+
+
+def ambience(color: RGB) -> float:
+    return (0.299 * color[0] + 0.587 * color[1] + 0.114 * color[2]) / 255
+
+
+def contrasting(color: RGB) -> RGB:
+    d = 0 if ambience(color) > 0.5 else 255
+    return (d, d, d)
+
+
+def to_ascii(s: str):
+    """Removes words containing non-ascii chars"""
+    res: list[str] = []
+    for word in s.split():
+        try:
+            word.encode("ascii")
+        except UnicodeEncodeError:
+            continue
+        else:
+            res.append(word)
+    return " ".join(res)
+
+
+def encode(image: Image.Image) -> bytes:
+    buffer = BytesIO()
+    image.save(buffer, format="webp", quality=90)
+    return buffer.getvalue()
+
+
+def render(thumbnail: bytes, title: str, uploader: str) -> Tuple[RGB, RGB, bytes]:
+    """Draws a banner, returning its background and text colours and the encoded image.
+
+    Runs on a render pool worker; takes and returns only plain data so jobs are cheap to
+    send between processes.
+    """
+    if not hasattr(local, "fonts"):
+        load_fonts()
+    _normal, _bold = local.fonts
+    x, y = 900, 300  # canvas size
+    source = Image.open(BytesIO(thumbnail))
+    base, palette = quantize(source, 15)
+    fill = max(palette, key=lambda c: abs(ambience(base) - ambience(c)))
+    if abs(ambience(fill) - ambience(base)) < 0.3:
+        fill = contrasting(base)
+    gradient = Image.new("RGB", (x, y), base)
+    tx, ty = 250, 170
+    gap = (y - ty) // 2
+    gradient.paste(source.resize((tx, ty)), (50, gap))
+    pen = ImageDraw.Draw(gradient)
+    title = "\n".join(wrap(to_ascii(title), 22, max_lines=2))
+    uploader = "By " + uploader
+    start = tx + gap
+    tbox = pen.multiline_textbbox((start, gap), title, font=_bold, spacing=20)
+    ubox = pen.textbbox((start, tbox[3] + gap / 2), uploader, font=_normal)
+    cy = (y - (ubox[3] - tbox[1])) / 2  # centred y coordinate for title
+    titlex = ((x - start) - (tbox[2] - tbox[0])) / 3 + start
+    pen.multiline_text((titlex, cy), title, fill=fill, font=_bold)
+    pen.text(
+        (titlex, cy + (tbox[-1] - tbox[1]) + gap / 2),
+        uploader,
+        font=_normal,
+        fill=fill,
+    )
+    return base, fill, encode(gradient)
@@ -1,17 +1,24 @@
 from __future__ import annotations
 
 import asyncio
+import time
+from base64 import b64decode, b64encode
+from functools import partial
 from html import unescape
 from io import BytesIO
-from textwrap import wrap
+from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple, TypedDict
 
 from aiohttp import ClientSession
-from colorthief import ColorThief
-from discord import Color, Embed, File
-from PIL import Image, ImageDraw, ImageFont
+from discord import Color, Embed
 from pydantic import BaseModel
 
+from ..files import shared_file
+from ..metrics import metrics, timed
+from ..settings import MusicConfig
+from .cache import LRUCache, SingleFlight, Store
+from .pool import WorkerPool
+
 __all__ = (
     "BaseTrack",
     "Track",
@@ -36,111 +43,140 @@ class ThumbnailMixin:
         return await Banner.create(self, session=session)
 
 
+render_seconds = metrics.histogram(
+    "hk_banner_render_seconds", "Banner render time, including pool wait"
+)
+
+
+# Pillow and numpy are imported by whichever worker first needs them, never at startup
+def _load_fonts(normal: str, bold: str):
+    from .render import load_fonts
+
+    load_fonts(normal, bold)
+
+
+def _render(thumbnail: bytes, title: str, uploader: str):
+    from .render import render
+
+    return render(thumbnail, title, uploader)
+
+
 class Banner:
-    cache: Dict[str, Banner] = {}
+    """A rendered track banner, kept as encoded WebP bytes rather than a live Image.
+
+    Banners are cached in memory and, with ``banner_persist``, in a SQLite store
+    that every shard process reads from before rendering.
+    """
+
+    filename = "track.webp"
+    cache: LRUCache[str, Banner] = LRUCache(64 * 1024 * 1024, weigh=lambda b: len(b.data))
+    store: Optional[Store] = None
+    ttl: float = 30 * 24 * 60 * 60  # stored banners are re-rendered after this long
+    pool = WorkerPool("render")  # render() loads the default fonts itself
+    renders: SingleFlight[str, Banner] = SingleFlight()
+    downloads: SingleFlight[str, bytes] = SingleFlight()
 
     def __init__(
         self,
         track: ThumbnailMixin,
         background: Tuple[int, int, int],
         fill: Tuple[int, int, int],
-        image: Image.Image,
+        data: bytes,
     ):
         self.track = track
         self.background = background
         self.fill = fill
-        self.image = image
+        self.data = data
         self._embed = Embed(color=Color.from_rgb(*self.background)).set_image(
-            url="attachment://track.png"
+            url=f"attachment://{self.filename}"
+        )
+        self.cache.put(track.id, self)
+
+    @classmethod
+    def configure(cls, conf: MusicConfig):
+        cls.cache.maxsize = conf.banner_cache_bytes
+        cls.ttl = conf.banner_ttl
+        if conf.banner_persist:
+            cls.store = Store(Path(conf.cache_dir) / "banners.sqlite3", "banners")
+        cls.pool.shutdown()
+        cls.pool = WorkerPool(
+            "render",
+            kind=conf.render_executor,
+            size=conf.render_workers,
+            backlog=conf.render_backlog,
+            timeout=conf.render_timeout,
+            initializer=partial(_load_fonts, conf.font, conf.bold_font),
         )
-        self.cache[track.id] = self
+
+    @property
+    def image(self):
+        from PIL import Image
+
+        return Image.open(BytesIO(self.data))
 
     @property
     def embed(self):
         return self._embed.copy()
 
-    @staticmethod
-    def get_palette(
-        file: BytesIO,
-    ) -> Tuple[Tuple[int, int, int], List[Tuple[int, int, int]]]:
-        cf = ColorThief(file)
-        return cf.get_color(100), cf.get_palette(15, 100)  # type: ignore
-
-    @staticmethod
-    def ambience(color: Tuple[int, int, int]) -> float:
-        return (0.299 * color[0] + 0.587 * color[1] + 0.114 * color[2]) / 255
-
-    @staticmethod
-    def contrasting(color: Tuple[int, int, int]):
-        d = 0 if Banner.ambience(color) > 0.5 else 255
-        return (d, d, d)
-
-    @staticmethod
-    def to_ascii(s: str):
-        """Removes words containing non-ascii chars"""
-        res: list[str] = []
-        for word in s.split():
-            try:
-                word.encode("ascii")
-            except UnicodeEncodeError:
-                continue
-            else:
-                res.append(word)
-        return " ".join(res)
-
-    @staticmethod
-    def generate(
-        track: ThumbnailMixin,
-        buffer: BytesIO,
-        *,
-        normal: str = "static/font.otf",
-        bold: str = "static/bold.otf",
-    ):
-        x, y = 900, 300  # canvas size
-        base, palette = Banner.get_palette(buffer)
-        fill = max(
-            palette, key=lambda c: abs(Banner.ambience(base) - Banner.ambience(c))
-        )
-        if abs(Banner.ambience(fill) - Banner.ambience(base)) < 0.3:
-            fill = Banner.contrasting(base)
-        gradient = Image.new("RGB", (x, y), base)
-        tx, ty = 250, 170
-        thumbnail = Image.open(buffer).resize((tx, ty))
-        gap = (y - ty) // 2
-        gradient.paste(thumbnail, (50, gap))
-        pen = ImageDraw.Draw(gradient)
-        _normal = ImageFont.truetype(normal, 20)
-        _bold = ImageFont.truetype(bold, 40)
-        title = Banner.to_ascii(track.title)
-        title = "\n".join(wrap(title, 22, max_lines=2))
-        uploader = "By " + track.uploader
-        start = tx + gap
-        tbox = pen.multiline_textbbox((start, gap), title, font=_bold, spacing=20)
-        ubox = pen.textbbox((start, tbox[3] + gap / 2), uploader, font=_normal)
-        cy = (y - (ubox[3] - tbox[1])) / 2  # centred y coordinate for title
-        titlex = ((x - start) - (tbox[2] - tbox[0])) / 3 + start
-        pen.multiline_text((titlex, cy), title, fill=fill, font=_bold)
-        pen.text(
-            (titlex, cy + (tbox[-1] - tbox[1]) + gap / 2),
-            uploader,
-            font=_normal,
-            fill=fill,
-        )
-        return Banner(track, base, fill, gradient)
-
     def file(self):
-        buffer = BytesIO()
-        self.image.save(buffer, format="png")
-        buffer.seek(0)
-        return File(buffer, filename="track.png")
+        """Returns a File over the banner's encoded bytes, no encoding or copying happens here"""
+        return shared_file(self.data, self.filename)
+
+    @classmethod
+    async def download(cls, url: str, *, session: ClientSession) -> bytes:
+        async def fetch():
+            async with session.get(url) as resp:
+                resp.raise_for_status()
+                return await resp.read()
+
+        return await cls.downloads.do(url, fetch)
 
     @classmethod
+    async def load(cls, track: ThumbnailMixin) -> Optional[Banner]:
+        """Returns the track's banner from the on-disk store, if any process rendered it"""
+        if cls.store is None:
+            return None
+        if (row := await cls.store.lookup(track.id)) is None:
+            return None
+        stored, _ = row
+        background, fill = tuple(stored["background"]), tuple(stored["fill"])
+        return Banner(track, background, fill, b64decode(stored["data"]))  # type: ignore
+
+    @classmethod
+    async def purge(cls):
+        if cls.store is not None:
+            await asyncio.to_thread(cls.store.purge, time.time() - cls.ttl)
+
+    async def save(self):
+        if self.store is not None:
+            stored = {
+                "background": self.background,
+                "fill": self.fill,
+                "data": b64encode(self.data).decode(),
+            }
+            await self.store.save(self.track.id, stored)
+
+    @classmethod
+    @timed("hk_banner_seconds", "Time to get a banner, including cache hits")
     async def create(cls, track: ThumbnailMixin, *, session: ClientSession):
         if banner := cls.cache.get(track.id):
             return banner
-        resp = await session.get(track.get_thumbnail())
-        buffer = BytesIO(await resp.content.read())
-        return await asyncio.to_thread(Banner.generate, track, buffer)
+
+        async def generate():
+            if banner := await cls.load(track):
+                return banner
+            data = await cls.download(track.get_thumbnail(), session=session)
+            start = time.perf_counter()
+            background, fill, image = await cls.pool.run(
+                _render, data, track.title, track.uploader
+            )
+            if metrics.enabled:
+                render_seconds.observe(time.perf_counter() - start)
+            banner = Banner(track, background, fill, image)
+            await banner.save()
+            return banner
+
+        return await cls.renders.do(track.id, generate)
 
 
 class Thumbnail(TypedDict):
@@ -160,6 +196,7 @@ class Track(BaseTrack):
 
     url: str
     duration: float
+    acodec: Optional[str] = None
     uploader: str
     thumbnails: List[Thumbnail]
     thumbnail: str
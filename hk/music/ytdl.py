@@ -1,15 +1,30 @@
+from __future__ import annotations
+
 import asyncio
+import time
+import unicodedata
+from dataclasses import dataclass
+from itertools import islice
 from logging import getLogger
+from pathlib import Path
 from re import compile
-from typing import Any, Dict, Union
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, Iterable, List, Optional, Union
+from urllib.parse import parse_qs, quote_plus, urlparse
 
 from aiohttp import ClientSession
-from yt_dlp import YoutubeDL
 
+from ..metrics import timed
+from ..settings import MusicConfig
+from .cache import LRUCache, SingleFlight, Store
 from .errors import UnknownTrackException
+from .index import TitleIndex
+from .pool import TRANSIENT, WorkerPool, local
 from .track import APIItem, APIResult, BasePlaylist, BaseTrack, Track
 
-__all__ = ("YTDL",)
+if TYPE_CHECKING:
+    from yt_dlp import YoutubeDL
+
+__all__ = ("YTDL", "MetadataCache", "SearchCache", "youtube_dl")
 
 logger = getLogger("discord")
 
@@ -18,67 +33,330 @@ VIDEO = compile(
     r"^(?:https?:\/\/)?(?:www\.)?(?:youtu\.be\/|youtube\.com\/(?:embed\/|v\/|watch\?v=|watch\?.+&v=))((\w|-){11})(?:\S+)?$"
 )
 PLAYLIST = compile(r"^.*(youtu.be\/|list=)([^#\&\?]*).*")
+URL_MARGIN = 5 * 60  # stop trusting a stream URL this long before it expires
+
+
+@dataclass
+class CacheEntry:
+    data: Dict[str, Any]
+    fetched: float
+
+
+class MetadataCache:
+    """Two-tier (memory LRU, then SQLite) cache of extracted track data keyed by video id.
+
+    Stable metadata and stream URLs expire separately. googlevideo URLs carry an
+    ``expire`` timestamp, which is honoured when it comes before ``url_ttl``.
+    """
+
+    def __init__(
+        self,
+        path: Optional[Path] = None,
+        *,
+        size: int = 1024,
+        metadata_ttl: float = 7 * 24 * 60 * 60,
+        url_ttl: float = 4 * 60 * 60,
+    ):
+        self.memory: LRUCache[str, CacheEntry] = LRUCache(size)
+        self.store = Store(path, "metadata") if path else None
+        self.metadata_ttl = metadata_ttl
+        self.url_ttl = url_ttl
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0  # metadata was cached but the stream URL had expired
 
+    def url_expiry(self, entry: CacheEntry) -> float:
+        expiry = entry.fetched + self.url_ttl
+        query = parse_qs(urlparse(entry.data.get("url", "")).query)
+        if expire := query.get("expire"):
+            try:
+                expiry = min(expiry, float(expire[0]) - URL_MARGIN)
+            except ValueError:
+                pass
+        return expiry
 
-class YTDL(YoutubeDL):
-    def __init__(self):
-        params: Dict[str, Any] = {
-            "format": "bestaudio",
-            "outtmpl": "%(extractor)s-%(id)s-%(title)s.%(ext)s",
-            "restrictfilenames": True,
-            "noplaylist": False,
-            "nocheckcertificate": True,
-            "ignoreerrors": True,
-            "logtostderr": False,
-            "quiet": True,
-            "no_warnings": True,
-            "default_search": "auto",
-            "source_address": "0.0.0.0",
-            "extract_flat": True,
-            "skip_download": True,
-            "logger": getLogger("discord"),
+    def valid(self, entry: CacheEntry, *, url: bool = True) -> bool:
+        now = time.time()
+        if url:
+            return now < self.url_expiry(entry)
+        return now < entry.fetched + self.metadata_ttl
+
+    async def lookup(self, _id: str) -> Optional[CacheEntry]:
+        if entry := self.memory.get(_id):
+            return entry
+        if self.store is not None:
+            if row := await self.store.lookup(_id):
+                entry = CacheEntry(*row)
+                self.memory.put(_id, entry)
+                return entry
+
+    async def get(self, _id: str, *, url: bool = True) -> Optional[Dict[str, Any]]:
+        """Returns cached data for the video, or None if missing or expired.
+
+        With ``url=False`` only the stable metadata needs to be fresh.
+        """
+        entry = await self.lookup(_id)
+        if entry is not None and self.valid(entry, url=url):
+            self.hits += 1
+            return entry.data
+        if entry is not None and self.valid(entry, url=False):
+            self.stale += 1
+        self.misses += 1
+
+    async def put(self, _id: str, data: Dict[str, Any]):
+        entry = CacheEntry(data, time.time())
+        self.memory.put(_id, entry)
+        if self.store is not None:
+            await self.store.save(_id, data, entry.fetched)
+
+    async def purge(self):
+        """Deletes stored entries whose metadata and stream URL have both expired"""
+        if self.store is not None:
+            before = time.time() - max(self.metadata_ttl, self.url_ttl)
+            await asyncio.to_thread(self.store.purge, before)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "memory": len(self.memory),
         }
-        super().__init__(params=params)
 
-    @classmethod
-    async def get_data(cls, uri: str) -> Dict[Any, Any]:
-        """Extracts video data from YouTube from the given URI"""
 
-        def to_thread() -> Dict[Any, Any]:
-            with cls() as yd:
-                data: Dict[Any, Any] = yd.extract_info(uri, download=False)
-            return data
+@dataclass
+class SearchEntry:
+    partials: List[BaseTrack]
+    fetched: float
+
+
+def normalize(query: str) -> str:
+    """Folds case, unicode compatibility forms and whitespace so equivalent queries share a key"""
+    return " ".join(unicodedata.normalize("NFKC", query).casefold().split())
+
+
+class SearchCache:
+    """LRU of parsed YouTube API search results keyed by normalized query, optionally persisted.
+
+    Memory hits hand back the already parsed partials, so no validation happens on a hit.
+    """
+
+    def __init__(self, path: Optional[Path] = None, *, size: int = 512, ttl: float = 24 * 60 * 60):
+        self.memory: LRUCache[str, SearchEntry] = LRUCache(size)
+        self.store = Store(path, "search") if path else None
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, query: str) -> Optional[List[BaseTrack]]:
+        key = normalize(query)
+        entry = self.memory.get(key)
+        if entry is None and self.store is not None:
+            if row := await self.store.lookup(key):
+                items, fetched = row
+                entry = SearchEntry([BaseTrack(**item) for item in items], fetched)
+                self.memory.put(key, entry)
+        if entry is not None and time.time() < entry.fetched + self.ttl:
+            self.hits += 1
+            return entry.partials
+        self.misses += 1
+
+    async def put(self, query: str, partials: List[BaseTrack]):
+        key = normalize(query)
+        entry = SearchEntry(partials, time.time())
+        self.memory.put(key, entry)
+        if self.store is not None:
+            items = [partial.dict() for partial in partials]
+            await self.store.save(key, items, entry.fetched)
+
+    async def purge(self):
+        if self.store is not None:
+            await asyncio.to_thread(self.store.purge, time.time() - self.ttl)
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "memory": len(self.memory)}
+
+
+def youtube_dl(**overrides: Any) -> YoutubeDL:
+    """Returns a YoutubeDL with the bot's defaults, yt_dlp is only imported on first use"""
+    from yt_dlp import YoutubeDL
+
+    params: Dict[str, Any] = {
+        "format": "bestaudio",
+        "outtmpl": "%(extractor)s-%(id)s-%(title)s.%(ext)s",
+        "restrictfilenames": True,
+        "noplaylist": False,
+        "nocheckcertificate": True,
+        "ignoreerrors": True,
+        "logtostderr": False,
+        "quiet": True,
+        "no_warnings": True,
+        "default_search": "auto",
+        "source_address": "0.0.0.0",
+        "socket_timeout": 10,
+        "extract_flat": True,
+        "skip_download": True,
+        "logger": getLogger("discord"),
+    }
+    params.update(overrides)
+    return YoutubeDL(params=params)
 
-        return await asyncio.to_thread(to_thread)
+
+def _init_worker():
+    local.ytdl = youtube_dl()
+
+
+def _extract(uri: str) -> Optional[Dict[Any, Any]]:
+    ytdl: YoutubeDL = local.ytdl
+    data = ytdl.extract_info(uri, download=False)
+    return ytdl.sanitize_info(data)  # plain, picklable data for process pools
+
+
+class YTDL:
+    cache = MetadataCache()
+    pool = WorkerPool("ytdl", initializer=_init_worker)
+    flights: SingleFlight[str, Track] = SingleFlight()
+    searches = SearchCache()
+    index = TitleIndex()
+    search_flights: SingleFlight[str, List[BaseTrack]] = SingleFlight()
+
+    @classmethod
+    def configure(cls, conf: MusicConfig):
+        cls.cache = MetadataCache(
+            Path(conf.cache_dir) / "metadata.sqlite3",
+            size=conf.metadata_cache_size,
+            metadata_ttl=conf.metadata_ttl,
+            url_ttl=conf.url_ttl,
+        )
+        cls.searches = SearchCache(
+            Path(conf.cache_dir) / "metadata.sqlite3" if conf.search_persist else None,
+            size=conf.search_cache_size,
+            ttl=conf.search_ttl,
+        )
+        cls.index.size = conf.index_size
+        cls.pool.shutdown()
+        cls.pool = WorkerPool(
+            "ytdl",
+            kind=conf.extract_executor,
+            size=conf.extract_workers,
+            backlog=conf.extract_backlog,
+            timeout=conf.extract_timeout,
+            initializer=_init_worker,
+        )
 
     @classmethod
+    @timed("hk_ytdl_extract_seconds", "yt-dlp extraction time, including pool wait")
+    async def get_data(cls, uri: str) -> Optional[Dict[Any, Any]]:
+        """Extracts video data from YouTube from the given URI"""
+        return await cls.pool.run(_extract, uri)
+
+    @classmethod
+    @timed("hk_youtube_search_seconds", "YouTube Data API search time")
     async def from_api(cls, query: str, *, session: ClientSession, api_key: str):
-        resp = await session.get(SEARCH.format(query, api_key))
-        json = await resp.json()
+        async with session.get(SEARCH.format(quote_plus(query), api_key)) as resp:
+            json = await resp.json()
         if not json.get("items"):
             raise UnknownTrackException(query)
         return APIResult(**json)
 
     @classmethod
-    async def to_track(cls, partial: Union[BaseTrack, APIItem]):
-        if not isinstance(partial, Track):
-            _id = str(partial.id)
-            data = await cls.get_data(_id)
-            if data is None:
-                raise UnknownTrackException(_id)
+    async def search(
+        cls, query: str, *, session: ClientSession, api_key: str
+    ) -> List[BaseTrack]:
+        """Returns search results for the query, only spending API quota on a cache miss"""
+        if partials := await cls.searches.get(query):
+            return partials
+
+        async def fetch():
+            partials = (await cls.from_api(query, session=session, api_key=api_key)).partials()
+            await cls.searches.put(query, partials)
+            for partial in partials:
+                cls.index.add(partial)
+            return partials
+
+        return await cls.search_flights.do(normalize(query), fetch)
+
+    @classmethod
+    async def get_track(cls, _id: str, *, url: bool = True) -> Track:
+        """Returns the full Track for a video id, extracting only on a cache miss.
+
+        With ``url=False`` a cached Track whose stream URL has expired is still returned,
+        for callers that only show its metadata. Concurrent calls for the same id share
+        one lookup and extraction.
+        """
+        key = _id if url else f"{_id}:metadata"
+        return await cls.flights.do(key, lambda: cls._get_track(_id, url=url))
+
+    @classmethod
+    async def _get_track(cls, _id: str, *, url: bool = True) -> Track:
+        if data := await cls.cache.get(_id, url=url):
             return Track(**data)
-        return partial
+        data = await cls.get_data(_id)
+        if data is None:
+            raise UnknownTrackException(_id)
+        track = Track(**data)
+        await cls.cache.put(_id, track.dict())
+        cls.index.add(track)
+        return track
+
+    @classmethod
+    async def to_track(cls, partial: Union[BaseTrack, APIItem]):
+        # full Tracks go through the cache too, their stream URL may have expired (e.g. when looping)
+        return await cls.get_track(str(partial.id))
+
+    @classmethod
+    async def resolve(
+        cls, partials: Iterable[BaseTrack], *, batch: int = 8, retries: int = 2
+    ) -> AsyncIterator[BaseTrack]:
+        """Resolves partials concurrently, ``batch`` at a time, yielding Tracks in order.
+
+        Unavailable videos are dropped. Entries the extraction pool was too busy for are
+        retried ``retries`` times with a backoff, then yielded unresolved so that they're
+        resolved at play time instead. Only one batch is held in memory at once.
+        """
+        entries = iter(partials)
+        while chunk := list(islice(entries, batch)):
+            results: List[Any] = await asyncio.gather(
+                *(cls.to_track(partial) for partial in chunk), return_exceptions=True
+            )
+            for attempt in range(retries):
+                failed = [i for i, result in enumerate(results) if isinstance(result, TRANSIENT)]
+                if not failed:
+                    break
+                await asyncio.sleep(2**attempt)
+                retried = await asyncio.gather(
+                    *(cls.to_track(chunk[i]) for i in failed), return_exceptions=True
+                )
+                for i, result in zip(failed, retried):
+                    results[i] = result
+            for partial, result in zip(chunk, results):
+                if isinstance(result, Track):
+                    yield result
+                elif isinstance(result, UnknownTrackException):
+                    logger.info(f"Dropping {partial.id} from playlist: {result}")
+                elif isinstance(result, TRANSIENT):
+                    logger.warning(f"Queueing {partial.id} unresolved: {result!r}")
+                    yield partial
+                elif isinstance(result, BaseException):
+                    raise result
+
+    @classmethod
+    async def purge(cls):
+        """Drops expired entries from the on-disk caches"""
+        await asyncio.gather(cls.cache.purge(), cls.searches.purge())
 
     @classmethod
     async def from_query(cls, query: str, *, session: ClientSession, api_key: str):
+        # results are only shown, queued Tracks get a fresh stream URL at play time
         if match := VIDEO.match(query):
-            data = await cls.get_data(match.group(1))
-            ret = (Track(**data),)
+            ret = (await cls.get_track(match.group(1), url=False),)
         elif PLAYLIST.match(query):
             data = await cls.get_data(query)
-            ret = (BasePlaylist(**data),)
+            playlist = BasePlaylist(**data)
+            cls.index.add(playlist)
+            for entry in playlist.entries:
+                cls.index.add(entry)
+            ret = (playlist,)
         else:
-            ret = tuple(
-                (await cls.from_api(query, session=session, api_key=api_key)).partials()
-            )
+            ret = tuple(await cls.search(query, session=session, api_key=api_key))
         return ret
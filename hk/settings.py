@@ -1,12 +1,12 @@
 from os import environ
-from typing import List, Optional
+from typing import List, Literal, Optional
 
 import yaml
 from dotenv import load_dotenv
 from pydantic import BaseModel
 from typing_extensions import TypedDict
 
-__all__ = ("Config",)
+__all__ = ("Config", "HTTPConfig", "MetricsConfig", "MusicConfig")
 
 
 class Emojis(TypedDict):
@@ -25,6 +25,66 @@ class EnvVars(TypedDict):
     DATABASE_URI: str
 
 
+class HTTPConfig(BaseModel):
+    """Connection pool and timeout settings for the shared aiohttp session"""
+
+    limit: int = 100
+    limit_per_host: int = 10  # one slow host can't hold every socket
+    dns_ttl: int = 300
+    keepalive: float = 30
+    timeout: float = 20
+    connect_timeout: float = 5
+    read_timeout: float = 10
+
+
+class MetricsConfig(BaseModel):
+    """Instrumentation, off by default"""
+
+    enabled: bool = False
+    host: str = "127.0.0.1"
+    port: Optional[int] = None  # serve Prometheus text on /metrics, offset by the first shard id
+    log_interval: Optional[float] = None  # seconds between dumps to the log
+
+
+class MusicConfig(BaseModel):
+    """Tuning knobs for the music package"""
+
+    cache_dir: str = ".cache"
+    metadata_cache_size: int = 1024
+    metadata_ttl: float = 7 * 24 * 60 * 60  # title, duration, thumbnails
+    url_ttl: float = 4 * 60 * 60  # googlevideo stream URLs go stale after a few hours
+    search_cache_size: int = 512
+    search_ttl: float = 24 * 60 * 60
+    search_persist: bool = False  # also keep search results in the on-disk cache
+    index_size: int = 5000  # titles kept for autocomplete
+    prefetch: int = 2  # upcoming tracks to resolve while the current one plays
+    prefetch_concurrency: int = 2
+    extract_executor: Literal["thread", "process"] = "thread"
+    extract_workers: int = 4
+    extract_backlog: int = 32  # queued extractions beyond the workers before failing fast
+    extract_timeout: float = 30
+    eager_playlists: bool = False  # resolve playlist entries up front instead of at play time
+    playlist_batch: int = 8
+    banner_cache_bytes: int = 64 * 1024 * 1024  # encoded banners are ~50 KiB each
+    banner_persist: bool = False  # also keep banners on disk, shared by every shard process
+    banner_ttl: float = 30 * 24 * 60 * 60  # age past which stored banners are purged
+    render_executor: Literal["thread", "process"] = "process"
+    render_workers: int = 2
+    render_backlog: int = 32
+    render_timeout: float = 15
+    audio_cache: bool = False  # download hot tracks and play them from disk
+    audio_cache_bytes: int = 2 * 1024 * 1024 * 1024
+    audio_cache_threshold: int = 3  # plays before a track is downloaded, looping tracks always are
+    opus_passthrough: bool = True  # let ffmpeg produce Opus instead of encoding PCM in-process
+    volume: float = 0.5  # for new voice clients, at 1 passthrough stream copies Opus sources
+    gapless: bool = False  # preload the next track into a PCM mixer, overrides opus_passthrough
+    crossfade: float = 0  # seconds of overlap between gapless tracks
+    persist_queues: bool = False  # checkpoint queues to disk and restore them on startup
+    checkpoint_interval: float = 5  # seconds between journal flushes
+    font: str = "static/font.otf"
+    bold_font: str = "static/bold.otf"
+
+
 class Config(BaseModel):
     """Configuration settings"""
 
@@ -35,6 +95,12 @@ class Config(BaseModel):
     prefix: str = "hk "
     intents: int = 3276543
     extensions: List[str] = []
+    sync_file: str = ".cache/commands.sha256"  # hash of the last command tree synced to Discord
+    processes: int = 1  # worker processes to spread shards over
+    shards: Optional[int] = None  # total shard count, Discord's recommendation when unset
+    http: HTTPConfig = HTTPConfig()
+    music: MusicConfig = MusicConfig()
+    metrics: MetricsConfig = MetricsConfig()
     env: EnvVars
 
     def __init__(self, fp: Optional[str] = None):
@@ -1,16 +1,17 @@
 from __future__ import annotations
 
-from copy import deepcopy
-from typing import Optional
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Sequence, Tuple
 
 from discord import ButtonStyle, Embed, File, Interaction
 from discord.ui import Button, View, button
 
 from .bot import Bot
+from .files import Attachment
 
 
 class Unit:
-    __slots__ = ("content", "embed", "_files")
+    __slots__ = ("content", "embed", "attachments")
 
     def __init__(
         self,
@@ -21,21 +22,64 @@ class Unit:
     ):
         self.content = content
         self.embed = embed
-        self._files = files or []
+        self.attachments = [Attachment.from_file(f) for f in files or []]
 
     @property
     def files(self):
-        """Returns a list of deepcopies of the original files for reusability"""
-        return [deepcopy(f) for f in self._files]
+        """Returns new Files over the original payloads, which are never copied"""
+        return [a.file() for a in self.attachments]
+
+
+class PageSource(ABC):
+    """Renders a Paginator's pages on demand"""
+
+    @property
+    def version(self) -> int:
+        """Changes whenever already rendered pages may be out of date"""
+        return 0
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+    @abstractmethod
+    async def render(self, page: int) -> Unit:
+        ...
+
+
+class StaticPages(PageSource):
+    """Pages that were all built up front"""
+
+    def __init__(self, items: Sequence[Unit]):
+        self.items = items
+
+    def __len__(self):
+        return len(self.items)
+
+    async def render(self, page: int) -> Unit:
+        return self.items[page]
 
 
 class Paginator(View):
-    """Simple embed and file paginator view"""
+    """Simple embed and file paginator view.
+
+    Takes either the pages themselves or a PageSource, which is only asked for the
+    pages that are actually shown. Rendered pages within ``window`` of the current
+    one are kept until the source's version changes.
+    """
 
-    def __init__(self, bot: Bot, *items: Unit):
+    def __init__(
+        self,
+        bot: Bot,
+        *items: Unit,
+        source: Optional[PageSource] = None,
+        window: int = 2,
+    ):
         super().__init__()
         self.bot = bot
-        self.items = items
+        self.source = source if source is not None else StaticPages(items)
+        self.window = window
+        self.cache: Dict[int, Tuple[int, Unit]] = {}  # page -> (version, unit)
         self.page = 0
 
         for child in self.children:
@@ -44,9 +88,23 @@ class Paginator(View):
                     child.style = ButtonStyle.primary
                 child.emoji = self.bot.conf.emojis[child.callback.callback.__name__]  # type: ignore (child.callback is _ViewCallback here)
 
+    @property
+    def last(self):
+        return max(len(self.source) - 1, 0)
+
+    async def get(self, page: int) -> Unit:
+        version = self.source.version
+        cached = self.cache.get(page)
+        if cached is None or cached[0] != version:
+            cached = self.cache[page] = (version, await self.source.render(page))
+        for key, (v, _) in list(self.cache.items()):
+            if v != version or abs(key - page) > self.window:
+                del self.cache[key]
+        return cached[1]
+
     async def edit(self, iact: Interaction, *, page: int):
-        self.page = page
-        unit = self.items[page]
+        self.page = page = min(page, self.last)  # the source may have shrunk
+        unit = await self.get(page)
         await iact.response.edit_message(
             content=unit.content, embed=unit.embed, attachments=unit.files
         )
@@ -61,8 +119,8 @@ class Paginator(View):
 
     @button()
     async def next(self, iact: Interaction, button: Button[Paginator]):
-        await self.edit(iact, page=min(self.page + 1, len(self.items) - 1))
+        await self.edit(iact, page=min(self.page + 1, self.last))
 
     @button()
     async def skip(self, iact: Interaction, button: Button[Paginator]):
-        await self.edit(iact, page=len(self.items) - 1)
+        await self.edit(iact, page=self.last)
@@ -0,0 +1,83 @@
+import random
+
+import pytest
+
+from hk.music.blocklist import BlockList
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_matches_list(seed: int):
+    """Applies the same random operations to a BlockList and a list, small blocks force splits"""
+    rng = random.Random(seed)
+    blocks: BlockList[int] = BlockList(load=4)
+    items: list[int] = []
+    counter = 0
+    for _ in range(5000):
+        op = rng.choice(("append", "insert", "pop", "popleft", "move", "skip", "set", "del"))
+        n = len(items)
+        if op == "append" or not n:
+            counter += 1
+            blocks.append(counter)
+            items.append(counter)
+        elif op == "insert":
+            counter += 1
+            index = rng.randint(-n - 2, n + 2)
+            blocks.insert(index, counter)
+            items.insert(index, counter)
+        elif op == "pop":
+            index = rng.randrange(-n, n)
+            assert blocks.pop(index) == items.pop(index)
+        elif op == "popleft":
+            assert blocks.popleft() == items.pop(0)
+        elif op == "move":
+            source, destination = rng.randrange(n), rng.randrange(n)
+            blocks.move(source, destination)
+            items.insert(destination, items.pop(source))
+        elif op == "skip":
+            count = rng.randint(0, min(n, 12))
+            assert blocks.skip(count) == items[:count]
+            del items[:count]
+        elif op == "set":
+            counter += 1
+            index = rng.randrange(n)
+            blocks[index] = counter
+            items[index] = counter
+        elif op == "del":
+            index = rng.randrange(-n, n)
+            del blocks[index]
+            del items[index]
+        assert len(blocks) == len(items)
+        if items:
+            index = rng.randrange(-len(items), len(items))
+            assert blocks[index] == items[index]
+            start = rng.randrange(len(items))
+            assert list(blocks.page(start, start + 10)) == items[start : start + 10]
+    assert list(blocks) == items
+    assert blocks[2:9] == items[2:9]
+    assert blocks[::3] == items[::3]
+
+
+def test_out_of_range():
+    blocks = BlockList([1, 2, 3])
+    with pytest.raises(IndexError):
+        blocks[3]
+    with pytest.raises(IndexError):
+        blocks[-4]
+    with pytest.raises(IndexError):
+        BlockList().popleft()
+
+
+def test_shuffle_and_clear():
+    blocks = BlockList(range(100), load=8)
+    blocks.shuffle()
+    assert sorted(blocks) == list(range(100))
+    blocks.clear()
+    assert len(blocks) == 0 and list(blocks) == []
+    blocks.append(1)
+    assert blocks[0] == 1
+
+
+def test_skip_past_end():
+    blocks = BlockList(range(10), load=4)
+    assert blocks.skip(20) == list(range(10))
+    assert len(blocks) == 0
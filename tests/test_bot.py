@@ -0,0 +1,37 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+
+from hk.bot import Bot
+from hk.settings import Config
+
+ROOT = Path(__file__).parent.parent
+
+
+@pytest.fixture
+def conf(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Config:
+    for key in ("YOUTUBE", "DISCORD", "DATABASE_URI"):
+        monkeypatch.setenv(key, "test")
+    settings = tmp_path / "settings.yaml"
+    settings.write_text(f"music:\n  cache_dir: {tmp_path / 'cache'}\n")
+    monkeypatch.chdir(ROOT)  # extensions are found relative to the working directory
+    return Config(str(settings))
+
+
+async def loaded(conf: Config) -> Bot:
+    bot = Bot(conf)
+    for file in sorted(Path("hk/extensions").glob("*.py")):
+        await bot.load_extension(f"hk.extensions.{file.stem}")
+    return bot
+
+
+def test_tree_hash_is_stable(conf: Config):
+    async def main():
+        bot = await loaded(conf)
+        assert bot.tree.get_commands()
+        first = bot.tree_hash()
+        assert bot.tree_hash() == first
+        assert (await loaded(conf)).tree_hash() == first  # e.g. after a restart
+
+    asyncio.run(main())
@@ -0,0 +1,37 @@
+from io import BytesIO, UnsupportedOperation
+
+import pytest
+from discord import File
+
+from hk.files import SharedBuffer, shared_file
+from hk.views import Unit
+
+
+def test_shared_buffer_is_read_only():
+    data = b"banner"
+    buffer = SharedBuffer(data)
+    assert buffer.read() == data
+    assert buffer.getbuffer().obj is data
+    with pytest.raises(UnsupportedOperation):
+        buffer.write(b"x")
+    with pytest.raises(UnsupportedOperation):
+        buffer.truncate(0)
+
+
+def test_unit_files_share_the_payload():
+    data = b"x" * 1024
+    unit = Unit(files=[shared_file(data, "track.webp")])
+    first, second = unit.files[0], unit.files[0]
+    assert first is not second
+    assert first.fp.getbuffer().obj is data and second.fp.getbuffer().obj is data
+    assert first.fp.read() == data
+    assert second.fp.read() == data  # reading one File doesn't move the other
+    assert first.filename == "track.webp"
+
+
+def test_unit_reads_plain_files_once():
+    unit = Unit(files=[File(BytesIO(b"page"), filename="page.png", spoiler=True)])
+    files = unit.files
+    assert files[0].fp.read() == b"page"
+    assert files[0].filename == "SPOILER_page.png"
+    assert unit.files[0].fp.read() == b"page"
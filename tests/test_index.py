@@ -0,0 +1,40 @@
+from hk.music.index import TitleIndex
+from hk.music.track import BaseTrack
+
+
+def track(_id: str, title: str) -> BaseTrack:
+    return BaseTrack(id=_id, title=title, description=None, uploader="hk", thumbnails=[])
+
+
+def test_search_by_prefixes():
+    index = TitleIndex()
+    index.add(track("a", "Never Gonna Give You Up"))
+    index.add(track("b", "Gangnam Style"))
+    assert [e.id for e in index.search("gon giv")] == ["a"]
+    assert {e.id for e in index.search("g")} == {"a", "b"}
+    assert index.search("style never") == []
+
+
+def test_played_ranks_history():
+    index = TitleIndex()
+    index.add(track("a", "Song One"))
+    index.add(track("b", "Song Two"))
+    index.played(1, track("b", "Song Two"))
+    assert [e.id for e in index.search("song", guild=1)] == ["b", "a"]
+    assert [e.id for e in index.search("", guild=1)] == ["b"]
+
+
+def test_evicts_least_recently_seen():
+    index = TitleIndex(size=2)
+    for _id in "abc":
+        index.add(track(_id, f"Track {_id}"))
+    assert len(index) == 2
+    assert {e.id for e in index.search("track")} == {"b", "c"}
+    assert index.tokens == sorted(index.tokens) and len(index.tokens) == 4
+
+
+def test_played_with_no_room():
+    index = TitleIndex(size=0)
+    index.played(1, track("a", "Song"))  # the entry is evicted as soon as it's added
+    assert len(index) == 0
+    assert index.search("", guild=1) == []
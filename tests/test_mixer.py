@@ -0,0 +1,174 @@
+import shutil
+import struct
+import subprocess
+from pathlib import Path
+from typing import Any, List
+
+import pytest
+
+from hk.music.audio import LOCAL_OPTS, Audio, Mixer
+
+SAMPLES = 960 * 2  # one 20ms stereo frame at 48kHz
+
+
+def frame(value: int) -> bytes:
+    return struct.pack(f"<{SAMPLES}h", *([value] * SAMPLES))
+
+
+def level(data: bytes) -> int:
+    return struct.unpack_from("<h", data)[0]
+
+
+class Tone:
+    """Stands in for Audio, ``frames`` frames of a constant sample value"""
+
+    def __init__(self, value: int, frames: int):
+        self.value = value
+        self.frames = frames
+        self.done = 0
+        self.volume = 0.5
+        self.cleaned = False
+
+    def read(self) -> bytes:
+        self.done += 20
+        if self.done > self.frames * 20:
+            return b""
+        return frame(self.value)
+
+    def cleanup(self):
+        self.cleaned = True
+
+
+def mixer(current: Tone, *, crossfade: int = 0, switched: List[Any]) -> Mixer:
+    return Mixer(
+        current,  # type: ignore
+        current.frames * 20,
+        crossfade=crossfade,
+        on_switch=switched.append,
+    )
+
+
+def drain(mix: Mixer) -> List[int]:
+    levels = []
+    while data := mix.read():
+        levels.append(level(data))
+    return levels
+
+
+def test_switch_without_gap():
+    switched: List[Any] = []
+    first, second = Tone(1000, 3), Tone(2000, 2)
+    mix = mixer(first, switched=switched)
+    mix.preload(second, 40, "next")  # type: ignore
+    assert drain(mix) == [1000, 1000, 1000, 2000, 2000]
+    assert switched == ["next"]
+    assert first.cleaned and mix.current is second
+
+
+def test_no_preload_ends():
+    switched: List[Any] = []
+    mix = mixer(Tone(1000, 2), switched=switched)
+    assert drain(mix) == [1000, 1000]
+    assert switched == []
+
+
+def test_crossfade():
+    switched: List[Any] = []
+    first, second = Tone(0, 10), Tone(4000, 10)
+    mix = mixer(first, crossfade=80, switched=switched)
+    mix.preload(second, 200, "next")  # type: ignore
+    levels = drain(mix)
+    # the last 80ms (4 frames) of the first track overlap the start of the second
+    assert levels[:6] == [0] * 6
+    fade = levels[6:10]
+    assert all(0 < a < b for a, b in zip(fade, fade[1:]))
+    assert fade[-1] == 4000
+    assert levels[10:] == [4000] * 6
+    assert len(levels) == 10 + 10 - 4
+    assert switched == ["next"]
+
+
+def test_crossfade_waits_for_preload():
+    switched: List[Any] = []
+    first, second = Tone(0, 5), Tone(4000, 5)
+    mix = mixer(first, crossfade=40, switched=switched)
+    levels = [level(mix.read()) for _ in range(4)]
+    mix.preload(second, 100, "late")  # type: ignore
+    levels += drain(mix)
+    assert levels[:4] == [0] * 4
+    assert 0 < levels[4] <= 4000
+    assert switched == ["late"]
+
+
+def test_discard():
+    switched: List[Any] = []
+    first, second = Tone(1000, 2), Tone(2000, 2)
+    mix = mixer(first, switched=switched)
+    mix.preload(second, 40, "next")  # type: ignore
+    mix.discard()
+    assert second.cleaned
+    assert drain(mix) == [1000, 1000]
+    assert switched == []
+
+
+def test_preload_replaces_preload():
+    switched: List[Any] = []
+    first, second, third = Tone(1000, 1), Tone(2000, 1), Tone(3000, 1)
+    mix = mixer(first, switched=switched)
+    mix.preload(second, 20, "second")  # type: ignore
+    mix.preload(third, 20, "third")  # type: ignore
+    assert second.cleaned and not third.cleaned
+    assert drain(mix) == [1000, 3000]
+    assert switched == ["third"]
+
+
+def test_replace():
+    switched: List[Any] = []
+    first, seeked, second = Tone(1000, 3), Tone(1500, 2), Tone(2000, 1)
+    mix = mixer(first, switched=switched)
+    mix.preload(second, 20, "next")  # type: ignore
+    assert level(mix.read()) == 1000
+    assert mix.replace(seeked) is first  # type: ignore
+    assert not first.cleaned  # the caller cleans it up once the player thread is done with it
+    assert drain(mix) == [1500, 1500, 2000]
+    assert switched == ["next"]
+
+
+def test_volume():
+    switched: List[Any] = []
+    first, second = Tone(1000, 1), Tone(2000, 1)
+    mix = mixer(first, switched=switched)
+    mix.preload(second, 20)  # type: ignore
+    mix.volume = 0.8
+    assert first.volume == second.volume == mix.volume == 0.8
+
+
+def test_cleanup():
+    switched: List[Any] = []
+    first, second = Tone(1000, 1), Tone(2000, 1)
+    mix = mixer(first, switched=switched)
+    mix.preload(second, 20)  # type: ignore
+    mix.cleanup()
+    assert first.cleaned and second.cleaned
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs ffmpeg")
+def test_local_files(tmp_path: Path):
+    files = []
+    for name, freq in (("a", 440), ("b", 880)):
+        file = tmp_path / f"{name}.wav"
+        subprocess.run(
+            ["ffmpeg", "-v", "quiet", "-f", "lavfi", "-i", f"sine={freq}:duration=1", str(file)],
+            check=True,
+        )
+        files.append(file)
+    switched: List[Any] = []
+    first, second = (Audio(str(file), volume=1, opts=LOCAL_OPTS) for file in files)
+    mix = Mixer(first, 1000, crossfade=200, on_switch=switched.append)
+    mix.preload(second, 1000, "b")
+    frames = 0
+    while mix.read():  # stops at the first empty read, so any gap ends it early
+        frames += 1
+    mix.cleanup()
+    assert switched == ["b"]
+    assert 50 + 50 - 10 - 2 <= frames <= 50 + 50 - 10 + 2  # 200ms of overlap
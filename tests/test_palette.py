@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from hk.music.palette import quantize
+
+RED, GREEN, BLUE = (200, 30, 30), (30, 180, 60), (20, 40, 220)
+
+
+def regions(*parts: tuple, size=(480, 360)) -> Image.Image:
+    """Vertical bands of colour, each ``share`` of the width"""
+    width, height = size
+    image = Image.new("RGB", size)
+    x = 0
+    for color, share in parts:
+        band = round(width * share)
+        image.paste(color, (x, 0, x + band, height))
+        x += band
+    return image
+
+
+def close(a, b, tolerance: int = 12) -> bool:
+    return all(abs(x - y) <= tolerance for x, y in zip(a, b))
+
+
+@pytest.mark.parametrize(
+    "parts, expected",
+    [
+        (((RED, 0.6), (GREEN, 0.3), (BLUE, 0.1)), RED),
+        (((BLUE, 0.2), (GREEN, 0.5), (RED, 0.3)), GREEN),
+        (((RED, 0.35), (GREEN, 0.25), (BLUE, 0.4)), BLUE),
+    ],
+)
+def test_dominant(parts, expected):
+    dominant, palette = quantize(regions(*parts))
+    assert close(dominant, expected)
+    assert any(close(color, expected) for color in palette)
+
+
+def test_dominant_over_noise():
+    rng = np.random.default_rng(0)
+    pixels = np.empty((360, 480, 3), dtype=np.uint8)
+    pixels[:] = RED
+    pixels[:, 300:] = rng.integers(0, 256, (360, 180, 3))  # a busy 3/8 of the image
+    dominant, _ = quantize(Image.fromarray(pixels))
+    assert close(dominant, RED)
+
+
+def test_single_colour():
+    dominant, palette = quantize(Image.new("RGB", (320, 180), GREEN))
+    assert dominant == GREEN
+    assert palette == [GREEN]
+
+
+@pytest.mark.parametrize("mode", ["L", "P", "RGBA", "CMYK"])
+def test_modes(mode: str):
+    image = regions((RED, 0.7), (BLUE, 0.3)).convert(mode)
+    band = np.asarray(image.convert("RGB"))[:, :300].reshape(-1, 3)
+    expected = band.mean(axis=0)  # P is dithered to the web palette
+    dominant, palette = quantize(image)
+    assert close(dominant, expected)
+    assert all(len(color) == 3 for color in palette)
+
+
+@pytest.mark.parametrize("count", [1, 5, 15])
+def test_palette_length(count: int):
+    rng = np.random.default_rng(1)
+    image = Image.fromarray(rng.integers(0, 256, (90, 120, 3), dtype=np.uint8))
+    dominant, palette = quantize(image, count)
+    assert 1 <= len(palette) <= count
+    assert len(set(palette)) == len(palette) or count == 1
+    assert all(0 <= c <= 255 for color in (dominant, *palette) for c in color)
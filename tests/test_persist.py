@@ -0,0 +1,100 @@
+import random
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from hk.music.blocklist import BlockList
+from hk.music.persist import QueueJournal
+from hk.music.track import BaseTrack, Track
+
+
+def partial(n: int) -> BaseTrack:
+    return BaseTrack(id=str(n), title=f"Track {n}", description=None, uploader="hk", thumbnails=[])
+
+
+def ids(tracks: List[BaseTrack]) -> List[str]:
+    return [track.id for track in tracks]
+
+
+def flush(journal: QueueJournal):
+    events, journal.events = journal.events, []
+    journal.write(events, {}, [])
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_replay_matches_blocklist(tmp_path: Path, seed: int):
+    """Journals the same edits Queue makes to its BlockList, then replays them"""
+    rng = random.Random(seed)
+    journal = QueueJournal(tmp_path / "queues.sqlite3")
+    guild = 1
+    tracks: BlockList[BaseTrack] = BlockList(load=4)
+    counter = 0
+    for step in range(2000):
+        op = rng.choice(("add", "add", "get", "skip", "remove", "move", "shuffle"))
+        n = len(tracks)
+        if op == "add" or not n:
+            counter += 1
+            track = partial(counter)
+            tracks.append(track)
+            journal.add(guild, track)
+        elif op == "get":
+            tracks.popleft()
+            journal.drop(guild)
+        elif op == "skip":
+            skipped = tracks.skip(rng.randint(1, min(n, 5)))
+            journal.drop(guild, 0, len(skipped))
+        elif op == "remove":
+            index = rng.randrange(n)
+            tracks.pop(index)
+            journal.drop(guild, index)
+        elif op == "move":
+            source, destination = rng.randrange(n), rng.randrange(n)
+            tracks.move(source, destination)
+            journal.move(guild, source, destination)
+        elif op == "shuffle" and rng.random() < 0.1:
+            tracks.shuffle()
+            journal.reset(guild, list(tracks))
+        if step % 97 == 0:
+            flush(journal)
+    flush(journal)
+    states = journal.read(lambda _: True)
+    assert ids(states[guild].tracks) == ids(list(tracks))
+    # read() compacts each guild to a single reset event, which must replay the same
+    assert ids(journal.read(lambda _: True)[guild].tracks) == ids(list(tracks))
+
+
+def test_full_tracks_and_ownership(tmp_path: Path):
+    journal = QueueJournal(tmp_path / "queues.sqlite3")
+    full = Track(
+        id="full",
+        title="Full",
+        description=None,
+        uploader="hk",
+        thumbnails=[],
+        thumbnail="t",
+        url="u",
+        duration=1,
+    )
+    journal.add(1, full)
+    journal.add(2, partial(2))
+    flush(journal)
+    states = journal.read(lambda guild: guild == 1)
+    assert list(states) == [1]
+    assert isinstance(states[1].tracks[0], Track)
+    assert ids(journal.read(lambda guild: guild == 2)[2].tracks) == ["2"]
+
+
+def test_forget(tmp_path: Path):
+    journal = QueueJournal(tmp_path / "queues.sqlite3")
+    journal.add(1, partial(1))
+    flush(journal)
+    journal.forget(1)
+    journal.write([], {}, journal.forgotten)
+    assert journal.read(lambda _: True) == {}
+
+
+def test_disabled():
+    journal = QueueJournal()
+    journal.add(1, partial(1))
+    assert journal.events == []
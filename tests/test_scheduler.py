@@ -0,0 +1,157 @@
+import asyncio
+import time
+from itertools import count
+from types import SimpleNamespace
+from typing import Any, List, Optional, Tuple
+
+from discord import Embed, RateLimited
+
+from hk.music.queue import ProgressScheduler
+
+ids = count(1)
+
+
+class FakeQueue:
+    def __init__(self, progress: str = "Now Playing"):
+        self.progress = progress
+        self.voice = SimpleNamespace(resumed=asyncio.Event())
+        self.voice.resumed.set()
+
+
+class FakeMessage:
+    """Records edits as (time, footer), optionally holding them or failing the first ones"""
+
+    def __init__(self, channel: int = 1, *, errors: Optional[List[Exception]] = None):
+        self.id = next(ids)
+        self.channel = SimpleNamespace(id=channel)
+        self.embeds = [Embed(description="banner")]
+        self.edits: List[Tuple[float, Any]] = []
+        self.deleted = False
+        self.errors = errors or []
+        self.gate: Optional[asyncio.Event] = None
+
+    async def edit(self, *, embed: Embed):
+        if self.gate is not None:
+            await self.gate.wait()
+        if self.errors:
+            raise self.errors.pop(0)
+        self.edits.append((time.monotonic(), embed.footer.text))
+
+    async def delete(self):
+        self.deleted = True
+
+
+def footers(message: FakeMessage):
+    return [footer for _, footer in message.edits]
+
+
+async def settle(seconds: float = 0.05):
+    await asyncio.sleep(seconds)
+
+
+def test_urgent_requests_merge_into_one_follow_up():
+    async def main():
+        scheduler = ProgressScheduler(interval=60, spacing=0)
+        queue, message = FakeQueue("start"), FakeMessage()
+        scheduler.add(message, queue)  # type: ignore
+        message.gate = asyncio.Event()
+        queue.progress = "paused"
+        scheduler.request(queue)  # type: ignore
+        await settle()
+        for progress in ("resumed", "volume 80%", "looping"):
+            queue.progress = progress
+            scheduler.request(queue)  # type: ignore
+            await settle(0.01)
+        message.gate.set()
+        await settle()
+        assert footers(message) == ["paused", "looping"]
+        scheduler.task.cancel()
+
+    asyncio.run(main())
+
+
+def test_unchanged_footer_is_not_edited():
+    async def main():
+        scheduler = ProgressScheduler(interval=0.02, spacing=0)
+        queue, message = FakeQueue("same"), FakeMessage()
+        scheduler.add(message, queue)  # type: ignore
+        await settle(0.1)
+        assert message.edits == []
+        queue.voice.resumed.clear()  # paused, nothing to refresh
+        queue.progress = "moved on"
+        await settle(0.1)
+        assert message.edits == []
+        scheduler.task.cancel()
+
+    asyncio.run(main())
+
+
+def test_same_channel_edits_are_spaced():
+    async def main():
+        scheduler = ProgressScheduler(interval=60, spacing=0.2)
+        queue = FakeQueue("start")
+        first, second, elsewhere = FakeMessage(1), FakeMessage(1), FakeMessage(2)
+        for message in (first, second, elsewhere):
+            scheduler.add(message, queue)  # type: ignore
+        queue.progress = "changed"
+        scheduler.request(queue)  # type: ignore
+        await settle(0.4)
+        assert footers(first) == footers(second) == footers(elsewhere) == ["changed"]
+        (a, _), (b, _) = first.edits[0], second.edits[0]
+        assert abs(b - a) >= 0.19
+        assert abs(elsewhere.edits[0][0] - min(a, b)) < 0.1  # other channels aren't held up
+        scheduler.task.cancel()
+
+    asyncio.run(main())
+
+
+def test_rate_limit_backs_off_and_resends():
+    async def main():
+        scheduler = ProgressScheduler(interval=60, spacing=0)
+        queue, message = FakeQueue("start"), FakeMessage(errors=[RateLimited(0.2)])
+        scheduler.add(message, queue)  # type: ignore
+        queue.progress = "paused"
+        start = time.monotonic()
+        scheduler.request(queue)  # type: ignore
+        await settle(0.1)
+        assert message.edits == []  # still backing off
+        await settle(0.3)
+        assert footers(message) == ["paused"]
+        assert message.edits[0][0] - start >= 0.19
+        assert not message.deleted
+        scheduler.task.cancel()
+
+    asyncio.run(main())
+
+
+def test_failed_edit_drops_the_message():
+    async def main():
+        scheduler = ProgressScheduler(interval=60, spacing=0)
+        queue, message = FakeQueue("start"), FakeMessage(errors=[RuntimeError("gone")])
+        scheduler.add(message, queue)  # type: ignore
+        queue.progress = "paused"
+        scheduler.request(queue)  # type: ignore
+        await settle()
+        assert message.deleted and message.id not in scheduler.messages
+
+    asyncio.run(main())
+
+
+def test_release_deletes_the_queues_messages():
+    async def main():
+        scheduler = ProgressScheduler(interval=60, spacing=0)
+        queue, other = FakeQueue(), FakeQueue()
+        ours, theirs = FakeMessage(), FakeMessage()
+        scheduler.add(ours, queue)  # type: ignore
+        scheduler.add(theirs, other)  # type: ignore
+        scheduler.release(queue)  # type: ignore
+        await settle()
+        assert ours.deleted and not theirs.deleted
+        assert list(scheduler.messages) == [theirs.id]
+        queue.progress = "changed"
+        scheduler.request(queue)  # type: ignore
+        await settle()
+        assert ours.edits == []
+        scheduler.task.cancel()
+
+    asyncio.run(main())
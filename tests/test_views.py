@@ -0,0 +1,71 @@
+import asyncio
+from types import SimpleNamespace
+from typing import List
+
+import pytest
+from discord import Embed
+
+from hk.settings import Config
+from hk.views import PageSource, Paginator, Unit
+
+bot = SimpleNamespace(conf=SimpleNamespace(emojis=Config.__fields__["emojis"].default))
+
+
+class Pages(PageSource):
+    def __init__(self, count: int):
+        self.count = count
+        self.rendered: List[int] = []
+        self.generation = 0
+
+    @property
+    def version(self):
+        return self.generation
+
+    def __len__(self):
+        return self.count
+
+    async def render(self, page: int) -> Unit:
+        self.rendered.append(page)
+        return Unit(embed=Embed(description=str(page)))
+
+
+def test_page_source_is_abstract():
+    with pytest.raises(TypeError):
+        PageSource()  # type: ignore
+
+
+def test_empty_source_is_kept():
+    async def main():
+        source = Pages(0)
+        view = Paginator(bot, source=source)  # type: ignore
+        assert view.source is source
+        assert view.last == 0
+        assert (await view.get(0)).embed.description == "0"
+
+    asyncio.run(main())
+
+
+def test_pages_render_on_demand():
+    async def main():
+        source = Pages(10)
+        view = Paginator(bot, source=source, window=1)  # type: ignore
+        await view.get(0)
+        await view.get(0)
+        assert source.rendered == [0]
+        await view.get(5)
+        assert set(view.cache) == {5}  # page 0 is outside the window
+        source.generation += 1
+        await view.get(5)
+        assert source.rendered == [0, 5, 5]
+
+    asyncio.run(main())
+
+
+def test_static_pages():
+    async def main():
+        units = [Unit(content="a"), Unit(content="b")]
+        view = Paginator(bot, *units)  # type: ignore
+        assert view.last == 1
+        assert (await view.get(1)).content == "b"
+
+    asyncio.run(main())